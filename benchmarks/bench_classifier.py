@@ -0,0 +1,96 @@
+"""
+Micro-benchmark for the per-repo classification step on a synthetic tree.
+
+Compares the old approach (scan every language's extensions per file, filter the
+ignore lists per file, then rescan all line counts once per language) with the
+single pass through file_classifier.RepoTally.
+
+    python benchmarks/bench_classifier.py [--entries 100000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_classifier import DEFAULT_CLASSIFIER, FILE_EXTENSIONS, IGNORED_DIRECTORIES, IGNORED_EXTENSIONS, RepoTally
+
+
+def synthetic_tree(entries, seed=0):
+    rng = random.Random(seed)
+    extensions = [ext for exts in FILE_EXTENSIONS.values() for ext in exts] + ['.ts', '.rs', '.png', '.json', '.yml', '']
+    directories = ['src', 'app', 'tests', 'docs', 'node_modules/pkg', 'build', 'lib/vendor', 'web/static']
+    files = []
+    for i in range(entries):
+        directory = '/'.join(rng.choice(directories) for _ in range(rng.randint(1, 3)))
+        name = rng.choice(['Dockerfile', 'Makefile']) if i % 500 == 0 else f"file{i}{rng.choice(extensions)}"
+        files.append({"path": f"{directory}/{name}", "type": "blob", "sha": f"{i:040x}", "size": rng.randint(10, 50_000)})
+    return files
+
+
+def legacy_breakdown(files, line_counts):
+    language_counts = defaultdict(int)
+    for file in files:
+        file_path = file['path']
+        for language, extensions in FILE_EXTENSIONS.items():
+            if any(file_path.endswith(ext) for ext in extensions):
+                language_counts[language] += 1
+                break
+
+    counted = []
+    for file in files:
+        file_path = file['path']
+        if '.' not in file_path or any(file_path.endswith(ext) for ext in IGNORED_EXTENSIONS) or any(dir in file_path.split('/') for dir in IGNORED_DIRECTORIES):
+            continue
+        counted.append(file_path)
+    counted_lines = {path: line_counts[path] for path in counted}
+
+    breakdown = {}
+    for language, count in language_counts.items():
+        breakdown[language] = {
+            "count": count,
+            "lines": sum(counted_lines[file] for file in counted_lines if file.endswith(tuple(FILE_EXTENSIONS[language]))),
+        }
+    return breakdown
+
+
+def tally_breakdown(files, line_counts):
+    tally = RepoTally(DEFAULT_CLASSIFIER)
+    for file in files:
+        tally.add_file(file)
+    tally.add_line_counts(line_counts)
+    return tally.languages
+
+
+def best_of(repeat, fn, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        # Fresh memo each round so the single pass is not timed against a warm cache
+        DEFAULT_CLASSIFIER._directory_ignored.clear()
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    files = synthetic_tree(args.entries)
+    line_counts = {file['path']: file['size'] // 40 for file in files}
+
+    legacy = best_of(args.repeat, legacy_breakdown, files, line_counts)
+    single_pass = best_of(args.repeat, tally_breakdown, files, line_counts)
+    print(f"{args.entries} entries, best of {args.repeat}")
+    print(f"  legacy scan:  {legacy * 1000:8.1f} ms")
+    print(f"  single pass:  {single_pass * 1000:8.1f} ms  ({legacy / single_pass:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
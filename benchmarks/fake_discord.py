@@ -0,0 +1,85 @@
+"""
+In-process stand-ins for the discord.py objects the bot's helpers touch:
+users/members that can be DMed, roles, and a command context. Sends take
+`latency` seconds; members can have closed DMs (403) or answer some sends
+with a 429 first, as Discord does under load.
+"""
+import asyncio
+import itertools
+
+import discord
+
+_ids = itertools.count(100_000_000_000_000_000)
+
+
+class _Response:
+    """Enough of an aiohttp response for discord.HTTPException to be built from it."""
+
+    def __init__(self, status, reason, headers=None):
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+
+
+class FakeMember:
+    def __init__(self, name, latency=0.0, closed_dms=False, rate_limited_sends=0, retry_after=0.01):
+        self.id = next(_ids)
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.dm_channel = None
+        self.latency = latency
+        self.closed_dms = closed_dms
+        self.rate_limited_sends = rate_limited_sends
+        self.retry_after = retry_after
+        self.received = []
+
+    async def send(self, content=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.closed_dms:
+            raise discord.Forbidden(_Response(403, "Forbidden"), "Cannot send messages to this user")
+        if self.rate_limited_sends:
+            self.rate_limited_sends -= 1
+            raise discord.HTTPException(
+                _Response(429, "Too Many Requests", {"Retry-After": str(self.retry_after)}), "You are being rate limited."
+            )
+        self.dm_channel = True
+        self.received.append(content)
+
+
+class FakeRole:
+    def __init__(self, name, members):
+        self.id = next(_ids)
+        self.name = name
+        self.members = members
+
+
+class FakeContext:
+    """A command context whose channel just records what the bot sent."""
+
+    def __init__(self, author=None):
+        self.author = author
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+
+
+class FakeMessage:
+    def __init__(self, author, content):
+        self.author = author
+        self.content = content
+
+
+def make_members(count, latency=0.0, closed_every=0, rate_limited_every=0):
+    """`count` members; every `closed_every`-th has closed DMs and every `rate_limited_every`-th gets one 429."""
+    members = []
+    for i in range(count):
+        members.append(FakeMember(
+            f"member{i}",
+            latency=latency,
+            closed_dms=bool(closed_every) and i % closed_every == 0,
+            rate_limited_sends=1 if rate_limited_every and i % rate_limited_every == 1 else 0,
+        ))
+    return members
@@ -0,0 +1,314 @@
+"""
+Local stand-in for the parts of the GitHub API the repo uses, serving
+synthetic repositories.
+
+A repo named `files-<N>` (optionally `files-<N>-<anything>`) has N files under
+a few directories, with a mix of languages, ignored files and binaries. File
+contents are generated from the repo name and index, so every repo has its own
+blobs with real git SHAs. As on GitHub, files under node_modules/ are vendored
+and left out of the language byte counts. Served endpoints:
+
+    GET  /repos/{owner}/{repo}/commits/HEAD      (application/vnd.github.sha, ETag)
+    GET  /repos/{owner}/{repo}/git/trees/{ref}   (ETag)
+    GET  /repos/{owner}/{repo}/git/blobs/{sha}   (raw media type)
+    GET  /repos/{owner}/{repo}/languages         (ETag)
+    GET  /repos/{owner}/{repo}/tarball[/{ref}]   (streamed .tar.gz)
+    POST /graphql                                (repository metadata and object(expression:) lookups)
+    GET  /_stats, POST /_reset                   (request counters for the benchmarks)
+    POST /_push/{owner}/{repo}                   (commit changes; returns a push webhook payload)
+
+Every response carries X-RateLimit-* headers from a budget of --rate-limit
+requests per --rate-window seconds; once it runs out requests get 403 until
+the window resets. --latency adds a delay to every request.
+
+    python benchmarks/fake_github.py [--port 8765] [--latency 0.005] [--rate-limit 100000]
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import re
+import tarfile
+import time
+from collections import Counter
+
+from aiohttp import web
+
+DIRECTORIES = ['src', 'src/core', 'app', 'tests', 'docs', 'web/static', 'node_modules/pkg', 'build']
+# (extension, language or None, binary)
+FILE_KINDS = [
+    ('.py', 'Python', False), ('.py', 'Python', False), ('.js', 'JavaScript', False),
+    ('.go', 'Go', False), ('.html', 'HTML', False), ('.css', 'CSS', False),
+    ('.md', 'Markdown', False), ('.json', None, False), ('.png', None, True), ('.txt', 'Text', False),
+]
+LANGUAGES = {extension: language for extension, language, _ in FILE_KINDS}
+VENDORED = ('node_modules/',)
+REPO_NAME = re.compile(r"^files-(\d+)(?:-.*)?$")
+
+
+def git_sha(content):
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class SyntheticRepo:
+    def __init__(self, owner, name, count):
+        self.owner = owner
+        self.name = name
+        self.head = hashlib.sha1(f"{owner}/{name}".encode()).hexdigest()
+        self.files = []
+        self.blobs = {}
+        for i in range(count):
+            extension, _, binary = FILE_KINDS[i % len(FILE_KINDS)]
+            path = f"{DIRECTORIES[i % len(DIRECTORIES)]}/file{i}{extension}"
+            self.files.append(self.add_blob(path, self.content(i, binary)))
+        # Every commit's files, so old commits can still be looked up after a push
+        self.commits = {self.head: self.files}
+        self.languages = self.count_languages()
+
+    def content(self, i, binary):
+        if binary:
+            return b"\x89PNG\r\n\x1a\n\0" + f"{self.name}:{i}".encode()
+        header = f"# {self.owner}/{self.name} file {i}\n".encode()
+        return header + b"value = 1\n" * (i % 60) + (b"end" if i % 7 == 0 else b"")
+
+    def add_blob(self, path, content):
+        sha = git_sha(content)
+        self.blobs[sha] = content
+        return {"path": path, "mode": "100644", "type": "blob", "sha": sha, "size": len(content)}
+
+    def count_languages(self):
+        languages = Counter()
+        for file in self.files:
+            language = LANGUAGES.get(file["path"][file["path"].rfind("."):])
+            if language and not file["path"].startswith(VENDORED):
+                languages[language] += file["size"]
+        return languages
+
+    def push(self, commits):
+        """
+        Commit `commits` (dicts with "added", "modified" and "removed" paths) on
+        top of the head and return the push webhook payload GitHub would send.
+        """
+        before = self.head
+        files = {file["path"]: file for file in self.files}
+        payload_commits = []
+        for commit in commits:
+            self.head = hashlib.sha1(f"{self.head}:{json.dumps(commit, sort_keys=True)}".encode()).hexdigest()
+            for path in commit.get("added", []) + commit.get("modified", []):
+                content = f"# {path} at {self.head}\n".encode() + b"value = 1\n" * (len(path) + len(self.commits))
+                files[path] = self.add_blob(path, content)
+            for path in commit.get("removed", []):
+                files.pop(path, None)
+            self.files = sorted(files.values(), key=lambda file: file["path"])
+            self.commits[self.head] = self.files
+            payload_commits.append({
+                "id": self.head,
+                "added": commit.get("added", []),
+                "removed": commit.get("removed", []),
+                "modified": commit.get("modified", []),
+            })
+        self.languages = self.count_languages()
+        return {
+            "ref": "refs/heads/main",
+            "before": before,
+            "after": self.head,
+            "created": False,
+            "deleted": False,
+            "forced": False,
+            "repository": {
+                "name": self.name,
+                "full_name": f"{self.owner}/{self.name}",
+                "default_branch": "main",
+                "owner": {"login": self.owner},
+            },
+            "commits": payload_commits,
+        }
+
+
+class FakeGitHub:
+    def __init__(self, latency=0.0, rate_limit=100_000, rate_window=3600.0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.repos = {}
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.not_modified = 0
+        self.rate_limited = 0
+        self.window_start = time.time()
+        self.used = 0
+
+    def repo(self, owner, name):
+        key = (owner, name)
+        if key not in self.repos:
+            match = REPO_NAME.match(name)
+            if not match:
+                raise web.HTTPNotFound(text='{"message": "Not Found"}', content_type="application/json")
+            self.repos[key] = SyntheticRepo(owner, name, int(match.group(1)))
+        return self.repos[key]
+
+    def rate_headers(self):
+        reset = self.window_start + self.rate_window
+        return {
+            "X-RateLimit-Limit": str(self.rate_limit),
+            "X-RateLimit-Remaining": str(max(0, self.rate_limit - self.used)),
+            "X-RateLimit-Reset": str(int(reset)),
+        }
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        if request.path.startswith("/_"):
+            return await handler(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if time.time() >= self.window_start + self.rate_window:
+            self.window_start = time.time()
+            self.used = 0
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[route] += 1
+        if self.used >= self.rate_limit:
+            self.rate_limited += 1
+            return web.json_response({"message": "API rate limit exceeded"}, status=403, headers=self.rate_headers())
+        try:
+            response = await handler(request)
+        except web.HTTPException as e:
+            response = e
+        if response.status == 304:
+            # Conditional requests that come back 304 are free on GitHub
+            self.not_modified += 1
+        else:
+            self.used += 1
+        if not response.prepared:
+            response.headers.update(self.rate_headers())
+        return response
+
+    def conditional(self, request, etag):
+        return request.headers.get("If-None-Match") == etag
+
+    async def head_commit(self, request):
+        repo = self.repo(request.match_info["owner"], request.match_info["repo"])
+        etag = f'"{repo.head}"'
+        if self.conditional(request, etag):
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(text=repo.head, headers={"ETag": etag})
+
+    async def tree(self, request):
+        repo = self.repo(request.match_info["owner"], request.match_info["repo"])
+        etag = f'"tree-{repo.head}"'
+        if self.conditional(request, etag):
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response({"sha": repo.head, "tree": repo.files, "truncated": False}, headers={"ETag": etag})
+
+    async def blob(self, request):
+        repo = self.repo(request.match_info["owner"], request.match_info["repo"])
+        content = repo.blobs.get(request.match_info["sha"])
+        if content is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=content, content_type="application/octet-stream")
+
+    async def languages(self, request):
+        repo = self.repo(request.match_info["owner"], request.match_info["repo"])
+        etag = f'"languages-{repo.head}"'
+        if self.conditional(request, etag):
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.json_response(dict(repo.languages), headers={"ETag": etag})
+
+    async def tarball(self, request):
+        repo = self.repo(request.match_info["owner"], request.match_info["repo"])
+        response = web.StreamResponse(headers={"Content-Type": "application/x-gzip", **self.rate_headers()})
+        await response.prepare(request)
+
+        # Build the archive as it is sent, so a 100k-file repo is never held in memory
+        buffer = io.BytesIO()
+        prefix = f"{repo.owner}-{repo.name}-{repo.head[:7]}/"
+        with tarfile.open(fileobj=buffer, mode="w|gz") as archive:
+            for file in repo.files:
+                content = repo.blobs[file["sha"]]
+                info = tarfile.TarInfo(prefix + file["path"])
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+                if buffer.tell() > 64 * 1024:
+                    await response.write(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+        await response.write(buffer.getvalue())
+        await response.write_eof()
+        return response
+
+    async def graphql(self, request):
+        variables = (await request.json()).get("variables", {})
+        if "owner" in variables:
+            repo = self.repo(variables["owner"], variables["name"])
+            nodes = {}
+            for key, expression in variables.items():
+                if key.startswith("e"):
+                    commit, path = expression.split(":", 1)
+                    file = next((f for f in repo.commits.get(commit, []) if f["path"] == path), None)
+                    nodes["f" + key[1:]] = {"oid": file["sha"], "byteSize": file["size"]} if file else None
+            return web.json_response({"data": {"repository": nodes}})
+
+        data, errors = {}, []
+        i = 0
+        while f"o{i}" in variables:
+            try:
+                repo = self.repo(variables[f"o{i}"], variables[f"n{i}"])
+            except web.HTTPNotFound:
+                data[f"r{i}"] = None
+                errors.append({"type": "NOT_FOUND", "path": [f"r{i}"], "message": f"Could not resolve to a Repository with the name '{variables[f'n{i}']}'."})
+            else:
+                data[f"r{i}"] = {
+                    "defaultBranchRef": {"name": "main", "target": {"oid": repo.head}},
+                    "languages": {"edges": [{"size": size, "node": {"name": name}} for name, size in repo.languages.most_common()]},
+                }
+            i += 1
+        data["rateLimit"] = {"cost": 1, "remaining": max(0, self.rate_limit - self.used)}
+        return web.json_response({"data": data, "errors": errors or None})
+
+    async def stats(self, request):
+        return web.json_response({
+            "requests": sum(self.requests.values()),
+            "by_route": dict(self.requests),
+            "not_modified": self.not_modified,
+            "rate_limited": self.rate_limited,
+        })
+
+    async def reset_stats(self, request):
+        self.reset()
+        return web.json_response({"ok": True})
+
+    async def push(self, request):
+        repo = self.repo(request.match_info["owner"], request.match_info["repo"])
+        return web.json_response(repo.push((await request.json())["commits"]))
+
+    def make_app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get("/repos/{owner}/{repo}/commits/HEAD", self.head_commit)
+        app.router.add_get("/repos/{owner}/{repo}/git/trees/{ref}", self.tree)
+        app.router.add_get("/repos/{owner}/{repo}/git/blobs/{sha}", self.blob)
+        app.router.add_get("/repos/{owner}/{repo}/languages", self.languages)
+        app.router.add_get("/repos/{owner}/{repo}/tarball", self.tarball)
+        app.router.add_get("/repos/{owner}/{repo}/tarball/{ref}", self.tarball)
+        app.router.add_post("/graphql", self.graphql)
+        app.router.add_get("/_stats", self.stats)
+        app.router.add_post("/_reset", self.reset_stats)
+        app.router.add_post("/_push/{owner}/{repo}", self.push)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic repositories on a GitHub-like API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument('--rate-limit', type=int, default=100_000, help="requests allowed per window")
+    parser.add_argument('--rate-window', type=float, default=3600.0, help="rate-limit window in seconds")
+    args = parser.parse_args()
+    server = FakeGitHub(args.latency, args.rate_limit, args.rate_window)
+    web.run_app(server.make_app(), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+"""
+End-to-end benchmarks that run offline: GitHub is benchmarks/fake_github.py
+started as a subprocess, Mongo is mongomock (in memory) and Discord is
+benchmarks/fake_discord.py.
+
+Scenarios:
+    process_repo_100, process_repo_10k, process_repo_100k
+                            count one synthetic repo from scratch (empty blob cache)
+    refresh_200_unchanged   file_count.main() over 200 stored repos, nothing changed on GitHub
+    refresh_200_stale       the same with the stored head commits forgotten, so every repo is re-read
+    push_replay             replay webhook-push-example.json, then a push that leaves only
+                            vendored JavaScript, through apply_pushes; fails unless each
+                            result matches a full recount of the new head
+    surveys_1000            1000 thermometer surveys answered at the same time
+    broadcast_role_1000     send_message_to_target() to a role of 1000 members, some with
+                            closed DMs and some answered with a 429 first
+
+Each reports wall time, GitHub API calls (as counted by the fake server) and
+peak memory allocated during the scenario (tracemalloc). --check compares
+against a saved baseline and exits 1 on a regression; API call counts must
+not grow at all, time and memory have a relative tolerance plus a small
+absolute allowance (0.25s, 1 MB).
+
+Needs mongomock-motor (pip install -r benchmarks/requirements.txt).
+
+    python benchmarks/run_benchmarks.py [--only process_repo_10k ...] [--skip-large]
+        [--latency 0.002] [--mode blobs] [--save-baseline benchmarks/baseline.json]
+        [--check benchmarks/baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from contextlib import asynccontextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCHMARKS)
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS, 'baseline.json')
+OWNER = 'bench'
+
+
+class FakeGitHubProcess:
+    """fake_github.py in its own process, so serving requests does not count against the code being measured."""
+
+    def __init__(self, port, latency, rate_limit):
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen([
+            sys.executable, os.path.join(BENCHMARKS, 'fake_github.py'),
+            '--port', str(port), '--latency', str(latency), '--rate-limit', str(rate_limit),
+        ])
+        deadline = time.monotonic() + 15
+        while True:
+            try:
+                self.stats()
+                return
+            except OSError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError("fake GitHub server did not start")
+                time.sleep(0.1)
+
+    def _call(self, path, method='GET', body=None):
+        data = json.dumps(body).encode() if body is not None else b'' if method == 'POST' else None
+        request = urllib.request.Request(self.url + path, method=method, data=data)
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return json.loads(response.read())
+
+    def stats(self):
+        return self._call('/_stats')
+
+    def reset(self):
+        self._call('/_reset', 'POST')
+
+    def prepare(self, repo_name):
+        """Have the server generate a repo before it is timed."""
+        self._call(f"/repos/{OWNER}/{repo_name}/languages")
+
+    def push(self, repo_name, commits):
+        """Commit changes to a repo on the server and return the push webhook payload."""
+        return self._call(f"/_push/{OWNER}/{repo_name}", 'POST', {"commits": commits})
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+class Bench:
+    def __init__(self, args, github_server, workdir):
+        self.args = args
+        self.github = github_server
+        self.workdir = workdir
+        self.result = None
+
+    @asynccontextmanager
+    async def measure(self):
+        """Times the block; setup done before it is not counted."""
+        self.github.reset()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        yield
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        stats = self.github.stats()
+        self.result = {
+            "wall_s": round(wall, 3),
+            "api_calls": stats["requests"],
+            "peak_mb": round((peak - before) / 1e6, 2) if tracemalloc.is_tracing() else None,
+        }
+        if stats["rate_limited"]:
+            self.result["rate_limited"] = stats["rate_limited"]
+
+    def fresh_blob_cache(self, name):
+        import blob_cache
+        if blob_cache._default_cache is not None:
+            blob_cache._default_cache.close()
+        blob_cache._default_cache = blob_cache.BlobCache(os.path.join(self.workdir, f"{name}.sqlite3"))
+
+    async def fresh_mongo(self):
+        import mongomock_motor
+
+        import db
+        import job_queue
+        import repo_store
+        db._client = mongomock_motor.AsyncMongoMockClient()
+        repo_store._ready = False
+        job_queue._ready = False
+        # Start from an empty rollup so ensure_ready has nothing to rebuild
+        await db.get_collection('global_stats').insert_one({"_id": repo_store.ROLLUP_ID})
+
+
+def process_repo_scenario(files):
+    async def scenario(bench):
+        import file_count
+        repo_name = f"files-{files}"
+        bench.fresh_blob_cache(repo_name)
+        bench.github.prepare(repo_name)
+        async with bench.measure():
+            repo_data = await file_count.process_repo(OWNER, repo_name, mode=bench.args.mode)
+        return {"files": files, "total_lines": repo_data["file_stats"]["repo_stats"]["total_lines"]}
+    return scenario
+
+
+async def seed_repos(bench, count, files):
+    """Count and store `count` small repos, the way they would be after $add_repo."""
+    import file_count
+    import repo_store
+    from github_client import GitHubClient
+    await bench.fresh_mongo()
+    bench.fresh_blob_cache(f"refresh-{count}")
+    semaphore = asyncio.Semaphore(20)
+
+    async def add(github, i):
+        async with semaphore:
+            repo_data = await file_count.process_repo(OWNER, f"files-{files}-{i}", github, mode=bench.args.mode)
+            repo_data["discord_user"] = "bench"
+            await repo_store.save_repo(repo_data)
+
+    async with GitHubClient() as github:
+        await asyncio.gather(*(add(github, i) for i in range(count)))
+
+
+def refresh_scenario(count, files, stale):
+    async def scenario(bench):
+        import db
+        import file_count
+        await seed_repos(bench, count, files)
+        if stale:
+            await db.get_collection('repos').update_many({}, {"$unset": {"sync.head_sha": ""}})
+        async with bench.measure():
+            await file_count.main(mode=bench.args.mode)
+        return {"repos": count}
+    return scenario
+
+
+async def push_replay_scenario(bench):
+    import file_count
+    import repo_store
+    from github_client import GitHubClient
+    from push_updates import apply_pushes
+
+    with open(os.path.join(ROOT, 'webhook-push-example.json')) as f:
+        example = json.load(f)
+    repo_name = "files-0-push"
+    await bench.fresh_mongo()
+    bench.fresh_blob_cache(repo_name)
+    # The files the example modifies or removes must be there before it; the
+    # vendored file stays JavaScript in the tree but not in GitHub's byte counts
+    touched = {path for commit in example["commits"] for path in commit["modified"] + commit["removed"]}
+    added = {path for commit in example["commits"] for path in commit["added"]}
+    bench.github.push(repo_name, [{"added": sorted(touched - added) + ["node_modules/pkg/vendored.js"]}])
+    repo_data = await file_count.process_repo(OWNER, repo_name, mode=bench.args.mode)
+    repo_data["discord_user"] = "bench"
+    await repo_store.save_repo(repo_data)
+
+    rounds = [
+        example["commits"],
+        # Leaves no JavaScript GitHub counts, so the stored size has to fall back to the tree's
+        [{"removed": sorted(path for path in added if path.endswith(".js"))}],
+    ]
+    outcomes = []
+    async with bench.measure():
+        async with GitHubClient() as github:
+            for commits in rounds:
+                payload = bench.github.push(repo_name, commits)
+                outcomes.append(await apply_pushes(github, OWNER, repo_name, [payload]))
+                stored = (await repo_store.get_repo(OWNER, repo_name))["file_stats"]
+                recount = (await file_count.process_repo(OWNER, repo_name, mode=bench.args.mode))["file_stats"]
+                if stored != recount:
+                    raise AssertionError(f"push {len(outcomes)} gave {stored}, a full recount gives {recount}")
+    return {"pushes": ", ".join(outcomes)}
+
+
+async def surveys_scenario(bench):
+    from fake_discord import FakeMessage, make_members
+    from survey import SurveySessions
+    from thermometer_store import ThermometerStore
+
+    store = ThermometerStore(os.path.join(bench.workdir, 'thermometer.sqlite3'))
+
+    async def on_complete(user_id, responses):
+        await asyncio.to_thread(store.append, user_id, responses)
+
+    sessions = SurveySessions(on_complete)
+    members = make_members(1000)
+    # One invalid score on the way, then two resource lines and "done"
+    answers = ["7", "eleven", "8", "6", "docs", "a mentor", "done"]
+    handled = 0
+    async with bench.measure():
+        await asyncio.gather(*(sessions.start(member) for member in members))
+        for answer in answers:
+            await asyncio.gather(*(sessions.handle_dm(FakeMessage(member, answer)) for member in members))
+            handled += len(members)
+    completed = sum(store.count(member.id) for member in members)
+    store.close()
+    return {"surveys": completed, "dms_handled": handled, "open_sessions": len(sessions)}
+
+
+async def broadcast_scenario(bench):
+    import broadcast
+    from fake_discord import FakeContext, FakeRole, make_members
+
+    members = make_members(1000, latency=bench.args.discord_latency, closed_every=25, rate_limited_every=50)
+    role = FakeRole("participants", members)
+    ctx = FakeContext()
+    async with bench.measure():
+        await broadcast.send_message_to_target(role, 'role', "Submissions close in one hour!", ctx)
+    return {
+        "sent": sum(1 for member in members if member.received),
+        "closed": sum(1 for member in members if member.closed_dms),
+        "report": ctx.sent[-1].splitlines()[0],
+    }
+
+
+SCENARIOS = {
+    "process_repo_100": process_repo_scenario(100),
+    "process_repo_10k": process_repo_scenario(10_000),
+    "process_repo_100k": process_repo_scenario(100_000),
+    "refresh_200_unchanged": refresh_scenario(200, 20, stale=False),
+    "refresh_200_stale": refresh_scenario(200, 20, stale=True),
+    "push_replay": push_replay_scenario,
+    "surveys_1000": surveys_scenario,
+    "broadcast_role_1000": broadcast_scenario,
+}
+LARGE_SCENARIOS = {"process_repo_100k"}
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, time_floor=0.25):
+    """
+    Regressions of `results` against `baseline`, as printable lines. Time may
+    grow by `time_tolerance` plus `time_floor` seconds, so run-to-run noise on
+    sub-second scenarios does not fail the check.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        if result["api_calls"] > base["api_calls"]:
+            regressions.append(f"{name}: {result['api_calls']} API calls, baseline {base['api_calls']}")
+        if result["wall_s"] > base["wall_s"] * (1 + time_tolerance) + time_floor:
+            regressions.append(f"{name}: {result['wall_s']:.3f}s, baseline {base['wall_s']:.3f}s")
+        # Allow 1 MB on top of the tolerance so tiny scenarios do not flap
+        if result["peak_mb"] is not None and base.get("peak_mb") is not None \
+                and result["peak_mb"] > base["peak_mb"] * (1 + memory_tolerance) + 1:
+            regressions.append(f"{name}: peak {result['peak_mb']:.1f} MB, baseline {base['peak_mb']:.1f} MB")
+    return regressions
+
+
+def print_table(results):
+    print(f"\n{'scenario':<24}{'wall (s)':>10}{'API calls':>11}{'peak (MB)':>11}  details")
+    for name, result in results.items():
+        peak = "-" if result["peak_mb"] is None else f"{result['peak_mb']:.1f}"
+        details = ", ".join(f"{key}={value}" for key, value in result.items() if key not in ("wall_s", "api_calls", "peak_mb"))
+        print(f"{name:<24}{result['wall_s']:>10.3f}{result['api_calls']:>11}{peak:>11}  {details}")
+
+
+async def run(args, names, workdir):
+    github_server = FakeGitHubProcess(args.port, args.latency, args.rate_limit)
+    results = {}
+    try:
+        for name in names:
+            print(f"Running {name}...")
+            bench = Bench(args, github_server, workdir)
+            extra = await SCENARIOS[name](bench)
+            results[name] = {**bench.result, **extra}
+    finally:
+        github_server.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--only', nargs='+', choices=list(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument('--skip-large', action='store_true', help="leave out the 100k-file repo")
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--latency', type=float, default=0.002, help="seconds the fake GitHub adds to every request")
+    parser.add_argument('--rate-limit', type=int, default=100_000, help="fake GitHub requests per hour")
+    parser.add_argument('--mode', choices=['blobs', 'archive'], default='blobs', help="how lines are counted")
+    parser.add_argument('--discord-latency', type=float, default=0.005, help="seconds each fake DM takes")
+    parser.add_argument('--discord-rate', type=float, default=1000,
+                        help="BROADCAST_REQUESTS_PER_SECOND; the real 40/s would make the broadcast pure waiting")
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc, which slows allocation-heavy code")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help="store the results as the baseline")
+    parser.add_argument('--check', nargs='?', const=DEFAULT_BASELINE, help="fail if worse than this baseline")
+    parser.add_argument('--time-tolerance', type=float, default=0.5, help="allowed wall time increase (0.5 = +50%%)")
+    parser.add_argument('--time-floor', type=float, default=0.25, help="seconds allowed on top of --time-tolerance")
+    parser.add_argument('--memory-tolerance', type=float, default=0.25, help="allowed peak memory increase")
+    args = parser.parse_args()
+
+    names = args.only or [name for name in SCENARIOS if not (args.skip_large and name in LARGE_SCENARIOS)]
+    settings = {"latency": args.latency, "mode": args.mode, "discord_latency": args.discord_latency,
+                "discord_rate": args.discord_rate, "memory": not args.no_memory}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # The repo modules read these when imported
+        os.environ.update({
+            "GITHUB_API_URL": f"http://127.0.0.1:{args.port}",
+            "GITHUB_PAT": "bench-token",
+            "BLOB_CACHE_PATH": os.path.join(workdir, 'blob_cache.sqlite3'),
+            "THERMOMETER_DB_PATH": os.path.join(workdir, 'thermometer.sqlite3'),
+            "BROADCAST_REQUESTS_PER_SECOND": str(args.discord_rate),
+            "METRICS_PORT": "0",
+        })
+        if not args.no_memory:
+            tracemalloc.start()
+        results = asyncio.run(run(args, names, workdir))
+
+    print_table(results)
+    output = {"settings": settings, "scenarios": results}
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {"settings": settings, "scenarios": {}}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as f:
+                baseline = json.load(f)
+        baseline["settings"] = settings
+        baseline["scenarios"].update(results)
+        with open(args.save_baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved baseline to {args.save_baseline}")
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != settings:
+            print(f"\nWarning: baseline was recorded with {baseline['settings']}, this run used {settings}")
+        regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance, args.time_floor)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+BLOB_CACHE_PATH = os.getenv("BLOB_CACHE_PATH", "blob_cache.sqlite3")
+# Oldest entries are evicted once the cache holds more blobs than this
+BLOB_CACHE_MAX_ENTRIES = int(os.getenv("BLOB_CACHE_MAX_ENTRIES", "500000"))
+
+# Bump when the way lines are counted changes, so old counts are thrown away
+SCHEMA_VERSION = 2
+
+# SQLite's default limit on host parameters in one statement is 999
+_CHUNK = 900
+
+
+class BlobCache:
+    """
+    Persistent map of git blob SHA -> (lines, size). `lines` is -1 for blobs
+    that were downloaded but are not counted (binary or too large).
+
+    A blob SHA is the hash of its content, so an entry never goes stale; the
+    only reason to drop one is to keep the file bounded, which is done LRU by
+    the `last_used` column.
+
+    Callers on an event loop run `get_many`/`put_many` with asyncio.to_thread;
+    a lock keeps those threads from using the connection at the same time.
+    """
+
+    def __init__(self, path=BLOB_CACHE_PATH, max_entries=BLOB_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        (version,) = self.conn.execute("PRAGMA user_version").fetchone()
+        if version != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS blobs")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " sha TEXT PRIMARY KEY,"
+            " lines INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        self.conn.commit()
+
+    def get_many(self, shas):
+        """Return `{sha: (lines, size)}` for the SHAs already cached and mark them as used."""
+        shas = list(shas)
+        found = {}
+        with self.lock:
+            for start in range(0, len(shas), _CHUNK):
+                chunk = shas[start:start + _CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(f"SELECT sha, lines, size FROM blobs WHERE sha IN ({placeholders})", chunk)
+                for sha, lines, size in rows:
+                    found[sha] = (lines, size)
+
+            if found:
+                now = time.time()
+                self.conn.executemany("UPDATE blobs SET last_used = ? WHERE sha = ?", [(now, sha) for sha in found])
+                self.conn.commit()
+        return found
+
+    def put_many(self, entries):
+        """Store `{sha: (lines, size)}` and evict the least recently used rows if over the limit."""
+        if not entries:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO blobs (sha, lines, size, last_used) VALUES (?, ?, ?, ?)",
+                [(sha, lines, size, now) for sha, (lines, size) in entries.items()],
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM blobs WHERE sha IN (SELECT sha FROM blobs ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_default_cache = None
+
+
+def get_blob_cache():
+    """The process-wide cache, opened on first use."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = BlobCache()
+    return _default_cache
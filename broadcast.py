@@ -0,0 +1,129 @@
+import asyncio
+import os
+import time
+
+import discord
+
+# Discord allows 50 requests/s per bot across all routes; leave headroom for the rest of the bot
+BROADCAST_REQUESTS_PER_SECOND = float(os.getenv("BROADCAST_REQUESTS_PER_SECOND", "40"))
+# DMs in flight at once during a role broadcast
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+MAX_RATE_LIMIT_RETRIES = 5
+# Names listed per category in the delivery report before it says "and N more"
+REPORT_NAME_LIMIT = 20
+
+
+class RequestPacer:
+    """
+    Spaces requests out so a broadcast stays under a requests-per-second budget.
+    A 429 from Discord pushes the next slot back for every sender, not just the
+    one that hit it.
+    """
+
+    def __init__(self, rate=BROADCAST_REQUESTS_PER_SECOND):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+
+    async def wait(self, cost=1):
+        now = time.monotonic()
+        start = max(now, self._next_slot)
+        self._next_slot = start + cost * self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def pause(self, seconds):
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+def retry_after_seconds(error):
+    """How long Discord asked us to wait, from a 429 HTTPException."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+async def send_dm(member, message, pacer):
+    """
+    DM one member, retrying 429s after the wait Discord asks for.
+    Returns `(outcome, detail)` with outcome "sent", "closed" or "error".
+    """
+    for _ in range(MAX_RATE_LIMIT_RETRIES + 1):
+        # Opening a DM channel is a request of its own
+        await pacer.wait(1 if member.dm_channel else 2)
+        try:
+            await member.send(message)
+            return "sent", None
+        except discord.Forbidden:
+            return "closed", None
+        except discord.RateLimited as e:
+            delay = e.retry_after
+        except discord.HTTPException as e:
+            if e.status != 429:
+                return "error", str(e)
+            delay = retry_after_seconds(e)
+        pacer.pause(delay)
+    return "error", "still rate limited after retries"
+
+
+async def broadcast_dm(members, message, concurrency=BROADCAST_CONCURRENCY, pacer=None):
+    """
+    DM every non-bot member concurrently and return a report:
+    `{"sent": int, "closed": [names], "errors": [(name, detail)]}`.
+    """
+    pacer = pacer or RequestPacer()
+    semaphore = asyncio.Semaphore(concurrency)
+    report = {"sent": 0, "closed": [], "errors": []}
+
+    async def deliver(member):
+        async with semaphore:
+            outcome, detail = await send_dm(member, message, pacer)
+        if outcome == "sent":
+            report["sent"] += 1
+        elif outcome == "closed":
+            report["closed"].append(member.name)
+        else:
+            report["errors"].append((member.name, detail))
+
+    await asyncio.gather(*(deliver(member) for member in members if not member.bot))
+    return report
+
+
+def _name_list(names):
+    shown = ", ".join(names[:REPORT_NAME_LIMIT])
+    if len(names) > REPORT_NAME_LIMIT:
+        shown += f" and {len(names) - REPORT_NAME_LIMIT} more"
+    return shown
+
+
+def format_report(target_name, report):
+    lines = [
+        f"Broadcast to {target_name}: {report['sent']} sent, "
+        f"{len(report['closed'])} with closed DMs, {len(report['errors'])} failed."
+    ]
+    if report["closed"]:
+        lines.append(f"Closed DMs: {_name_list(report['closed'])}")
+    if report["errors"]:
+        lines.append(f"Errors: {_name_list([f'{name} ({detail})' for name, detail in report['errors']])}")
+    # Stay inside Discord's 2000 character message limit
+    return "\n".join(lines)[:2000]
+
+
+async def send_message_to_target(target, target_type, message, ctx):
+    """
+    Sends a message to a target. If the target is a role, sends the message to all
+    members of the role and posts one delivery report to `ctx` at the end.
+    """
+    if target_type == 'role':
+        report = await broadcast_dm(target.members, message)
+        await ctx.send(format_report(target.name, report))
+    else:
+        outcome, detail = await send_dm(target, message, RequestPacer())
+        if outcome == "sent":
+            await ctx.send(f"Message sent to {target.name}.")
+        elif outcome == "closed":
+            await ctx.send(f"Could not send message to {target.name} (DMs might be closed).")
+        else:
+            await ctx.send(f"Failed to send message to {target.name} due to an error: {detail}")
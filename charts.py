@@ -0,0 +1,127 @@
+import asyncio
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Renderer processes; each keeps its own Kaleido server and Chrome running
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+# Rendered PNGs kept in memory (roughly 50 KB each)
+CHART_CACHE_ENTRIES = int(os.getenv("CHART_CACHE_ENTRIES", "500"))
+
+
+def _warm_renderer():
+    # Kaleido 1.x launches a new Chrome for every to_image call unless a sync
+    # server is running, so start one for the worker's lifetime
+    from multiprocessing.util import Finalize
+
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    try:
+        import kaleido
+
+        kaleido.start_sync_server(silence_warnings=True)
+        # Pool workers exit through multiprocessing's finalizers, not atexit
+        Finalize(None, kaleido.stop_sync_server, kwargs={"silence_warnings": True}, exitpriority=10)
+        pio.to_image(go.Figure(), format='png')
+    except Exception as e:
+        # Leave the worker usable; the same error surfaces on the first real render
+        print(f"Could not warm up the chart renderer: {e}")
+
+
+def _ready():
+    return True
+
+
+def render_thermometer_chart(response_numbers, function_scores, elegance_scores, effort_scores):
+    """Draw the $my_temps chart and return it as PNG bytes. Runs in a pool worker."""
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=response_numbers, y=function_scores, mode='lines+markers', name='Function'))
+    fig.add_trace(go.Scatter(x=response_numbers, y=elegance_scores, mode='lines+markers', name='Elegance'))
+    fig.add_trace(go.Scatter(x=response_numbers, y=effort_scores, mode='lines+markers', name='Effort'))
+
+    fig.update_layout(title='Thermometer Responses',
+                      xaxis_title='Response Number',
+                      yaxis_title='Score',
+                      legend_title='Questions')
+    return pio.to_image(fig, format='png')
+
+
+class ChartRenderer:
+    """
+    Renders thermometer charts in a process pool and caches the PNGs by
+    `(user_id, response_count)`. A user's responses only ever grow, so the
+    count identifies the chart; `invalidate` drops a user's old images when
+    they submit a new survey. Concurrent requests for the same chart share
+    one render.
+    """
+
+    def __init__(self, workers=CHART_WORKERS, max_entries=CHART_CACHE_ENTRIES):
+        self.workers = workers
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+        self._rendering = {}
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn, not fork: the bot process has gateway threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_warm_renderer,
+            )
+        return self._pool
+
+    async def warm_up(self):
+        """Start every worker (and its renderer) ahead of the first request."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, _ready) for _ in range(self.workers)))
+
+    async def thermometer_chart(self, user_id, response_numbers, function_scores, elegance_scores, effort_scores):
+        key = (user_id, len(response_numbers))
+        png = self.cache.get(key)
+        if png is not None:
+            self.cache.move_to_end(key)
+            return png
+
+        render = self._rendering.get(key)
+        if render is None:
+            render = asyncio.ensure_future(
+                self._render(key, response_numbers, function_scores, elegance_scores, effort_scores)
+            )
+            self._rendering[key] = render
+            render.add_done_callback(lambda _: self._rendering.pop(key, None))
+        # One caller giving up must not cancel the render for the others
+        return await asyncio.shield(render)
+
+    async def _render(self, key, *series):
+        loop = asyncio.get_running_loop()
+        try:
+            png = await loop.run_in_executor(self._get_pool(), render_thermometer_chart, *series)
+        except BrokenProcessPool:
+            # A worker died (e.g. the renderer crashed); start a fresh pool next time
+            self._pool = None
+            raise
+        self.cache[key] = png
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return png
+
+    def invalidate(self, user_id):
+        for key in [key for key in self.cache if key[0] == user_id]:
+            del self.cache[key]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,160 @@
+import numpy as np
+
+QUESTIONS = ("function", "elegance", "effort")
+EFFORT = QUESTIONS.index("effort")
+# Lines of output in $cohort_temps; older buckets and smaller drops are left out
+REPORT_BUCKETS = 12
+REPORT_DROPPING = 15
+
+
+class CohortScores:
+    """
+    Every thermometer check-in as parallel NumPy columns: `user_ids`,
+    `submitted_at` and a `scores` matrix with one column per question (NaN
+    where an answer is missing). `refresh` appends only the rows added to the
+    store since the last call, so keeping it current is cheap.
+    """
+
+    def __init__(self):
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.submitted_at = np.empty(0, dtype=np.float64)
+        self.scores = np.empty((0, len(QUESTIONS)), dtype=np.float64)
+        self.last_id = 0
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def refresh(self, store):
+        """Load check-ins added to `store` since the last refresh and return how many there were."""
+        rows = store.scores_since(self.last_id)
+        if not rows:
+            return 0
+        self.last_id = rows[-1][0]
+        # Discord IDs need all 64 bits, so they never pass through float64
+        user_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        # None (a score missing from an old file) becomes NaN
+        table = np.array([row[2:] for row in rows], dtype=np.float64)
+        self.user_ids = np.concatenate([self.user_ids, user_ids])
+        self.submitted_at = np.concatenate([self.submitted_at, table[:, 0]])
+        self.scores = np.concatenate([self.scores, table[:, 1:]])
+        return len(rows)
+
+    def bucket_summary(self, bucket_seconds, percentiles=(25, 50, 75), since=None):
+        """
+        Mean and percentiles of each question per time bucket.
+
+        Buckets are `bucket_seconds` wide, counted from the first check-in.
+        Returns a list of dicts in time order:
+        `{"start": ts, "count": n, "function": {"mean": m, "p50": ...}, ...}`.
+        """
+        keep = np.ones(len(self), dtype=bool) if since is None else self.submitted_at >= since
+        if not keep.any():
+            return []
+        times = self.submitted_at[keep]
+        scores = self.scores[keep]
+        origin = times.min()
+        bucket_ids, buckets = np.unique(((times - origin) // bucket_seconds).astype(np.int64), return_inverse=True)
+        counts = np.bincount(buckets, minlength=len(bucket_ids))
+
+        per_question = {}
+        for column, question in enumerate(QUESTIONS):
+            values = scores[:, column]
+            answered = ~np.isnan(values)
+            per_question[question] = _group_stats(buckets[answered], values[answered], len(bucket_ids), percentiles)
+
+        summary = []
+        for i, bucket_id in enumerate(bucket_ids):
+            row = {"start": origin + bucket_id * bucket_seconds, "count": int(counts[i])}
+            for question in QUESTIONS:
+                row[question] = {name: stat[i] for name, stat in per_question[question].items()}
+            summary.append(row)
+        return summary
+
+    def effort_dropping(self, window=2, min_drop=2.0):
+        """
+        Attendees whose effort has fallen: the mean of their last `window`
+        check-ins is at least `min_drop` below the mean of the ones before.
+
+        Returns `[(user_id, earlier_mean, recent_mean), ...]`, biggest drop first.
+        """
+        effort = self.scores[:, EFFORT]
+        answered = ~np.isnan(effort)
+        users, times, effort = self.user_ids[answered], self.submitted_at[answered], effort[answered]
+        if not len(users):
+            return []
+
+        order = np.lexsort((times, users))
+        users, effort = users[order], effort[order]
+        user_list, user_index, per_user = np.unique(users, return_inverse=True, return_counts=True)
+        # Position of each check-in counted back from the user's latest (0 = latest)
+        ends = np.cumsum(per_user)
+        from_end = ends[user_index] - 1 - np.arange(len(users))
+
+        recent = from_end < window
+        recent_count = np.bincount(user_index, weights=recent, minlength=len(user_list))
+        earlier_count = per_user - recent_count
+        recent_sum = np.bincount(user_index, weights=np.where(recent, effort, 0), minlength=len(user_list))
+        earlier_sum = np.bincount(user_index, weights=np.where(recent, 0, effort), minlength=len(user_list))
+
+        has_history = earlier_count > 0
+        recent_mean = np.divide(recent_sum, recent_count, out=np.zeros(len(user_list)), where=has_history)
+        earlier_mean = np.divide(earlier_sum, earlier_count, out=np.zeros(len(user_list)), where=has_history)
+        drop = earlier_mean - recent_mean
+        flagged = np.flatnonzero(has_history & (drop >= min_drop))
+        flagged = flagged[np.argsort(-drop[flagged], kind='stable')]
+        return [(int(user_list[i]), float(earlier_mean[i]), float(recent_mean[i])) for i in flagged]
+
+
+def _group_stats(groups, values, group_count, percentiles):
+    """Mean and linearly interpolated percentiles of `values` per group, all groups at once."""
+    counts = np.bincount(groups, minlength=group_count)
+    sums = np.bincount(groups, weights=values, minlength=group_count)
+    empty = counts == 0
+    stats = {"mean": np.where(empty, np.nan, sums / np.maximum(counts, 1))}
+
+    # Sort by group then value; each group's values are then one contiguous, sorted run
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    for p in percentiles:
+        position = starts + (np.maximum(counts, 1) - 1) * (p / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        if len(ordered):
+            low = np.minimum(low, len(ordered) - 1)
+            high = np.minimum(high, len(ordered) - 1)
+            value = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+        else:
+            value = np.full(group_count, np.nan)
+        stats[f"p{p}"] = np.where(empty, np.nan, value)
+    return stats
+
+
+def format_summary(summary, dropping, bucket_hours, names=None):
+    """Organizer-facing text for $cohort_temps, kept under Discord's 2000 character limit."""
+    names = names or {}
+    if not summary:
+        return "No thermometer responses yet."
+    lines = [f"Thermometer check-ins per {bucket_hours:g}h, UTC (mean / median / p25-p75):"]
+    if len(summary) > REPORT_BUCKETS:
+        lines.append(f"({len(summary) - REPORT_BUCKETS} earlier buckets not shown)")
+    for row in summary[-REPORT_BUCKETS:]:
+        start = np.datetime64(int(row["start"]), 's').astype(str).replace('T', ' ')[:16]
+        parts = []
+        for question in QUESTIONS:
+            stat = row[question]
+            if np.isnan(stat["mean"]):
+                parts.append(f"{question.title()} -")
+            else:
+                parts.append(f"{question.title()} {stat['mean']:.1f} / {stat['p50']:.1f} / {stat['p25']:.0f}-{stat['p75']:.0f}")
+        lines.append(f"`{start}` n={row['count']}: " + ", ".join(parts))
+
+    if dropping:
+        lines.append("")
+        lines.append("Effort dropping:")
+        for user_id, earlier, recent in dropping[:REPORT_DROPPING]:
+            lines.append(f"{names.get(user_id, user_id)}: {earlier:.1f} -> {recent:.1f}")
+        if len(dropping) > REPORT_DROPPING:
+            lines.append(f"and {len(dropping) - REPORT_DROPPING} more")
+    text = "\n".join(lines)
+    return text if len(text) <= 2000 else text[:1997] + "..."
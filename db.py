@@ -0,0 +1,55 @@
+import os
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient
+from pymongo.server_api import ServerApi
+
+import metrics
+
+load_dotenv()
+# MONGO_URI is what the bot read; mongo_uri is the name file_count used
+MONGO_URI = os.getenv("MONGO_URI") or os.getenv("mongo_uri")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "hackathon")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+
+_client = None
+
+
+def get_client():
+    """
+    The process-wide async client, created on first use.
+
+    Creating it does no I/O; the pool opens connections when the first
+    operation runs, so importing this module (or anything that uses it)
+    costs nothing.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            MONGO_URI,
+            server_api=ServerApi('1'),
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            event_listeners=metrics.mongo_listeners(),
+        )
+    return _client
+
+
+def get_db():
+    return get_client()[MONGO_DB_NAME]
+
+
+def get_collection(name):
+    return get_db()[name]
+
+
+async def ping():
+    await get_client().admin.command('ping')
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
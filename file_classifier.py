@@ -0,0 +1,122 @@
+FILE_EXTENSIONS = {
+    'Python': ['.py'],
+    'JavaScript': ['.js'],
+    'Java': ['.java'],
+    'C++': ['.cpp', '.h'],
+    'Ruby': ['.rb'],
+    'Go': ['.go'],
+    'HTML': ['.html', '.htm'],
+    'CSS': ['.css'],
+    'Markdown': ['.md'],
+    'Text': ['.txt', '.log'],
+}
+
+# Files recognised by their whole name rather than an extension
+FILE_NAMES = {
+    'Dockerfile': 'Dockerfile',
+    'Makefile': 'Makefile',
+}
+
+IGNORED_EXTENSIONS = ['.json', '.md', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.pdf', '.zip', '.tar', '.gz', '.rar', '.7z', '.exe', '.dll', '.so', '.dylib', '.gitignore', '.yaml', '.yml']
+IGNORED_DIRECTORIES = ['node_modules', 'venv', 'lib', 'libs', 'dist', 'build']
+
+# Directory lookups are memoised; the memo is dropped when it grows past this
+_DIRECTORY_CACHE_LIMIT = 100_000
+
+
+class FileClassifier:
+    """
+    Decides a file's language and whether its lines are counted, from hash lookups
+    on its extension, its name and its directory rather than scanning every rule.
+
+    A file is counted when it has an extension (or a known file name), the
+    extension is not ignored, and no directory on its path is ignored.
+    """
+
+    def __init__(self, file_extensions=FILE_EXTENSIONS, file_names=FILE_NAMES,
+                 ignored_extensions=IGNORED_EXTENSIONS, ignored_directories=IGNORED_DIRECTORIES):
+        self.by_extension = {}
+        for language, extensions in file_extensions.items():
+            for ext in extensions:
+                # First language listed wins, like the old `break` on first match
+                self.by_extension.setdefault(ext, language)
+        self.by_name = dict(file_names)
+        self.ignored_extensions = frozenset(ignored_extensions)
+        self.ignored_directories = frozenset(ignored_directories)
+        self._directory_ignored = {}
+
+    def is_ignored_directory(self, directory):
+        ignored = self._directory_ignored.get(directory)
+        if ignored is None:
+            if len(self._directory_ignored) > _DIRECTORY_CACHE_LIMIT:
+                self._directory_ignored.clear()
+            ignored = not self.ignored_directories.isdisjoint(directory.split('/'))
+            self._directory_ignored[directory] = ignored
+        return ignored
+
+    def classify(self, path):
+        """Return `(language, counted)` for a file path; `language` is None if unknown."""
+        slash = path.rfind('/')
+        name = path[slash + 1:]
+        dot = name.rfind('.')
+        extension = name[dot:] if dot != -1 else None
+
+        language = self.by_name.get(name)
+        if language is None and extension is not None:
+            language = self.by_extension.get(extension)
+
+        if extension is None:
+            counted = name in self.by_name
+        else:
+            counted = extension not in self.ignored_extensions
+        if counted and slash != -1:
+            counted = not self.is_ignored_directory(path[:slash])
+        return language, counted
+
+
+class RepoTally:
+    """
+    Per-language count, lines and size for one repo.
+
+    `add_file` classifies each tree entry exactly once; the entries whose lines
+    need counting are kept in `counted` with their language, so line totals are
+    added per file afterwards instead of rescanning the tree per language.
+    With `keep_counted=False` (lines added as files are read, e.g. from an
+    archive) nothing is kept per file.
+    """
+
+    def __init__(self, classifier, keep_counted=True):
+        self.classifier = classifier
+        self.keep_counted = keep_counted
+        self.languages = {}
+        self.counted = []
+        self.total_lines = 0
+        self.total_files = 0
+
+    def add_file(self, entry):
+        language, counted = self.classifier.classify(entry['path'])
+        if language is not None:
+            totals = self.languages.get(language)
+            if totals is None:
+                totals = self.languages[language] = {"count": 0, "lines": 0, "size": 0}
+            totals["count"] += 1
+            totals["size"] += entry.get('size', 0)
+        if counted and self.keep_counted:
+            self.counted.append((entry, language))
+        return language, counted
+
+    def add_lines(self, language, lines):
+        self.total_lines += lines
+        self.total_files += 1
+        if language is not None:
+            self.languages[language]["lines"] += lines
+
+    def add_line_counts(self, line_counts):
+        """Add `{path: lines}` for the counted files; files missing from it (binary, too large) are skipped."""
+        for entry, language in self.counted:
+            lines = line_counts.get(entry['path'])
+            if lines is not None:
+                self.add_lines(language, lines)
+
+
+DEFAULT_CLASSIFIER = FileClassifier()
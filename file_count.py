@@ -1,127 +1,356 @@
+import argparse
+import asyncio
+import io
 import json
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
-import requests
-from collections import defaultdict
-from dotenv import load_dotenv
+import tarfile
+import time
 import os
 
-GITHUB_API_URL = "https://api.github.com"
-load_dotenv()
-GITHUB_PAT = os.getenv("GITHUB_PAT")
-
-
-#set up the variables here for the inital mongo DB needs to be in the envfile  DONE
-load_dotenv()
-uri = os.environ('mongo_uri')
-# Create a new client and connect to the server
-client = MongoClient(uri, server_api=ServerApi('1'))
-#ping server 
-try:
-    client.admin.command('ping')
-    print("Pinged your deployment. You successfully connected to MongoDB!")
-except Exception as e:
-    print(e)
-
-FILE_EXTENSIONS = {
-    'Python': ['.py'],
-    'JavaScript': ['.js'],
-    'Java': ['.java'],
-    'C++': ['.cpp', '.h'],
-    'Ruby': ['.rb'],
-    'Go': ['.go'],
-    'HTML': ['.html', '.htm'],
-    'CSS': ['.css'],
-    'Markdown': ['.md'],
-    'Text': ['.txt', '.log'],
-}
-
-def get_headers():
-    headers = {}
-    if GITHUB_PAT:
-        headers["Authorization"] = f"token {GITHUB_PAT}"
-    return headers
-
-def fetch_files(repo_owner, repo_name):
-    response = requests.get(f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/git/trees/main?recursive=1", headers=get_headers())
-    response_data = response.json()
+import repo_store
+from blob_cache import get_blob_cache
+from file_classifier import DEFAULT_CLASSIFIER, RepoTally
+from github_client import DOWNLOAD_TIMEOUT, GitHubClient, GitHubError, RepoNotFound, track_calls
+from repo_metadata import fetch_metadata
+
+
+# "blobs" fetches each file through the git blobs API (cached by SHA);
+# "archive" streams one tarball per repo, which suits very large repos
+COUNT_MODE = os.getenv("COUNT_MODE", "blobs")
+# Bytes read at a time from a streamed response or archive member
+READ_CHUNK_SIZE = 64 * 1024
+# Files larger than this are left out of line counts (generated bundles, data dumps, ...)
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(5 * 1024 * 1024)))
+# A NUL byte in the first bytes of a file marks it as binary, the same heuristic git uses
+BINARY_SNIFF_BYTES = 8000
+# Stored in the blob cache for blobs that were fetched but turned out not countable
+NOT_COUNTED = -1
+# Downloaded blob counts are written to the cache this many at a time
+CACHE_WRITE_BATCH = 500
+# Repos refreshed at the same time by main(); the client still caps total in-flight requests
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", "10"))
+
+async def fetch_head_sha(github, repo_owner, repo_name, etag=None):
+    """
+    Return `(head_sha, etag)` for the repo's default branch, whatever it is
+    called; `head_sha` is None when GitHub answers 304 for `etag`.
+    """
+    # HEAD resolves to the default branch; the sha media type returns just the SHA as text
+    headers = {"Accept": "application/vnd.github.sha"}
+    if etag:
+        headers["If-None-Match"] = etag
+    async with github.stream(f"/repos/{repo_owner}/{repo_name}/commits/HEAD", headers) as response:
+        if response.status == 304:
+            return None, etag
+        if response.status != 200:
+            print(f"Error: could not read the head commit for repo {repo_owner}/{repo_name}")
+            return None, None
+        return (await response.text()).strip(), response.headers.get("ETag")
+
+async def fetch_files(github, repo_owner, repo_name, ref="HEAD", etag=None):
+    """Return `(files, etag)` for the tree at `ref`; `files` is None when GitHub answers 304 for `etag`."""
+    status, response_data, etag = await github.get_conditional(f"/repos/{repo_owner}/{repo_name}/git/trees/{ref}?recursive=1", etag)
     # print(f"{response_data = }")
-    
-    if 'tree' in response_data:
-        return response_data['tree']
+    if status == 304:
+        return None, etag
+
+    if response_data and 'tree' in response_data:
+        return response_data['tree'], etag
     else:
         print(f"Error: 'tree' key not found in the response for repo {repo_owner}/{repo_name}")
-        return []
-
-def count_files(files, file_extensions):
-    language_counts = defaultdict(int)
-    for file in files:
-        if file['type'] == 'blob':
-            file_path = file['path']
-            for language, extensions in file_extensions.items():
-                if any(file_path.endswith(ext) for ext in extensions):
-                    language_counts[language] += 1
-                    break
-    return language_counts
-
-def fetch_language_bytes(repo_owner, repo_name):
-    url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/languages"
-    response = requests.get(url, headers=get_headers())
-    if response.status_code == 403:
-        print("Rate limit exceeded. Try again later.")
-        exit()
-    return response.json()
-
-def count_lines_per_file(repo_owner, repo_name):
-    url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/git/trees/main?recursive=1"
-    response = requests.get(url, headers=get_headers())
-    if response.status_code == 403:
-        print("Rate limit exceeded. Try again later.")
-        exit()
-    files = response.json()['tree']
-    
-    ignored_extensions = ['.json', '.md', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.pdf', '.zip', '.tar', '.gz', '.rar', '.7z', '.exe', '.dll', '.so', '.dylib', '.gitignore', '.yaml', '.yml']
-    ignored_directories = ['node_modules', 'venv', 'lib', 'libs', 'dist', 'build']
-    
-    line_counts = {}
+        return [], None
+
+async def fetch_language_bytes(github, repo_owner, repo_name, etag=None):
+    """Return `(languages, etag)`; `languages` is None when GitHub answers 304 for `etag`."""
+    status, data, etag = await github.get_conditional(f"/repos/{repo_owner}/{repo_name}/languages", etag)
+    if status == 304:
+        return None, etag
+    if status == 404:
+        raise RepoNotFound(f"{repo_owner}/{repo_name} was not found on GitHub")
+    if status != 200:
+        raise GitHubError(f"Fetching languages for {repo_owner}/{repo_name} returned {status}")
+    return data, etag
+
+class LineCounter:
+    """
+    Counts a file's lines from chunks as they arrive, without holding the file.
+
+    Stops accepting data once the content looks binary or grows past
+    `max_size`; `lines` is None in either case.
+    """
+
+    def __init__(self, max_size=MAX_FILE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.newlines = 0
+        self.binary = False
+        self.too_large = False
+        self._last_byte = b''
+
+    def feed(self, chunk):
+        """Add a chunk; returns False once the rest of the file need not be read."""
+        if self.size < BINARY_SNIFF_BYTES and b'\0' in chunk[:BINARY_SNIFF_BYTES - self.size]:
+            self.binary = True
+            return False
+        self.size += len(chunk)
+        if self.size > self.max_size:
+            self.too_large = True
+            return False
+        if chunk:
+            self.newlines += chunk.count(b'\n')
+            self._last_byte = chunk[-1:]
+        return True
+
+    @property
+    def lines(self):
+        if self.binary or self.too_large:
+            return None
+        # A last line without a trailing newline still counts
+        return self.newlines + (1 if self._last_byte not in (b'', b'\n') else 0)
+
+async def fetch_blob_lines(github, repo_owner, repo_name, sha):
+    """
+    Stream a blob as raw bytes and return its line count, or None if it is
+    binary or over MAX_FILE_SIZE. The raw media type skips the base64/JSON
+    wrapping and works for blobs over 1 MB.
+    """
+    headers = {"Accept": "application/vnd.github.raw+json"}
+    async with github.stream(f"/repos/{repo_owner}/{repo_name}/git/blobs/{sha}", headers) as response:
+        if response.status != 200:
+            raise GitHubError(f"Fetching blob {sha} of {repo_owner}/{repo_name} returned {response.status}")
+        counter = LineCounter()
+        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+            if not counter.feed(chunk):
+                break
+        return counter.lines
+
+async def count_lines_per_file(github, repo_owner, repo_name, files, cache=None, progress=None):
+    """
+    Count lines for the tree entries in `files`, the ones the classifier marked
+    as counted (see RepoTally.counted). Blobs already in the SHA cache are not
+    downloaded again; the rest are fetched by as many workers as the client
+    allows requests in flight. Binary blobs and blobs over MAX_FILE_SIZE
+    are left out.
+
+    `progress`, if given, is called as `progress("blobs", done, total)` as
+    downloads finish.
+    """
+    if cache is None:
+        cache = get_blob_cache()
+
+    paths = []
     for file in files:
-        if file['type'] == 'blob':
-            file_path = file['path']
-            if '.' not in file_path or any(file_path.endswith(ext) for ext in ignored_extensions) or any(dir in file_path.split('/') for dir in ignored_directories):
+        if file.get('size', 0) <= MAX_FILE_SIZE:
+            paths.append((file['path'], file['sha'], file.get('size', 0)))
+
+    # SQLite calls run in a thread so the loop keeps serving other work
+    cached = await asyncio.to_thread(cache.get_many, {sha for _, sha, _ in paths})
+    missing = {sha: size for _, sha, size in paths if sha not in cached}
+
+    done = 0
+    fetched = {}
+    unsaved = {}
+    pending = iter(list(missing))
+
+    async def fetch_next():
+        # A fixed set of these share one iterator, so a 100k-file repo is not 100k tasks
+        nonlocal done
+        for sha in pending:
+            lines = await fetch_blob_lines(github, repo_owner, repo_name, sha)
+            fetched[sha] = unsaved[sha] = (NOT_COUNTED if lines is None else lines, missing[sha])
+            if len(unsaved) >= CACHE_WRITE_BATCH:
+                batch = dict(unsaved)
+                unsaved.clear()
+                await asyncio.to_thread(cache.put_many, batch)
+            done += 1
+            if progress:
+                progress("blobs", done, len(missing))
+
+    tasks = [asyncio.create_task(fetch_next()) for _ in range(min(github.max_in_flight, len(missing)))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # Stop the other downloads so they don't keep spending the rate limit
+        # or outlive the client they were started on
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        # Counts already downloaded are kept even if the repo failed, so a retry skips them
+        await asyncio.to_thread(cache.put_many, unsaved)
+    cached.update(fetched)
+
+    return {file_path: cached[sha][0] for file_path, sha, _ in paths if cached[sha][0] != NOT_COUNTED}
+
+class _StreamFile(io.RawIOBase):
+    """
+    Blocking file object over an aiohttp response body, for use from a worker thread.
+
+    Each read hands one chunk request back to the event loop, so only a chunk
+    or two of the download is ever held in memory.
+    """
+
+    def __init__(self, content, loop):
+        self.content = content
+        self.loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = asyncio.run_coroutine_threadsafe(self.content.read(len(buffer)), self.loop).result()
+        buffer[:len(data)] = data
+        return len(data)
+
+def walk_archive(fileobj, tally, progress=None):
+    """
+    Read a gzipped tarball as a stream, adding each file and its lines to `tally`
+    (a RepoTally made with keep_counted=False). `progress(files_read)` is called
+    every few hundred files.
+    """
+    files_read = 0
+    with tarfile.open(fileobj=fileobj, mode='r|gz') as archive:
+        for member in archive:
+            # TarFile keeps every member it has read; nothing here needs them again
+            archive.members = []
+            if not member.isfile():
                 continue
-            file_url = f"{GITHUB_API_URL}/repos/{repo_owner}/{repo_name}/git/blobs/{file['sha']}"
-            file_response = requests.get(file_url, headers=get_headers())
-            if file_response.status_code == 403:
-                print("Rate limit exceeded. Try again later.")
-                exit()
-            file_content = file_response.json()['content']
-            line_counts[file_path] = file_content.count('\n')
-    
-    return line_counts
-
-def process_repo(repo_owner, repo_name):
-    files = fetch_files(repo_owner, repo_name)
-    language_counts = count_files(files, FILE_EXTENSIONS)
-    languages_data = fetch_language_bytes(repo_owner, repo_name)
-    line_counts = count_lines_per_file(repo_owner, repo_name)
-
-    total_lines = sum(line_counts.values())
-    total_files = len(line_counts)
-    total_size = sum(languages_data.values())
+            files_read += 1
+            if progress and files_read % 500 == 0:
+                progress(files_read)
+            # GitHub puts everything under a single "<owner>-<repo>-<sha>/" directory
+            file_path = member.name.split('/', 1)[-1]
+            language, counted = tally.add_file({"path": file_path, "size": member.size})
+            if counted and member.size <= MAX_FILE_SIZE:
+                counter = LineCounter()
+                extracted = archive.extractfile(member)
+                while chunk := extracted.read(READ_CHUNK_SIZE):
+                    if not counter.feed(chunk):
+                        break
+                if counter.lines is not None:
+                    tally.add_lines(language, counter.lines)
+
+async def count_lines_from_archive(github, repo_owner, repo_name, tally, ref=None, progress=None):
+    """
+    Download the repo's tarball once and count lines while it streams in, instead
+    of one blobs API call per file. Memory stays bounded by the read chunk size.
+    Without a `ref` the default branch is downloaded.
+    """
+    path = f"/repos/{repo_owner}/{repo_name}/tarball" + (f"/{ref}" if ref else "")
+    async with github.stream(path, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status == 404:
+            raise RepoNotFound(f"{repo_owner}/{repo_name} was not found on GitHub")
+        if response.status != 200:
+            raise GitHubError(f"Fetching the tarball of {repo_owner}/{repo_name} returned {response.status}")
+        loop = asyncio.get_running_loop()
+        raw = _StreamFile(response.content, loop)
+        fileobj = io.BufferedReader(raw, READ_CHUNK_SIZE)
+
+        def report(files_read):
+            # Called from the worker thread; hand the update back to the loop
+            loop.call_soon_threadsafe(progress, "archive", files_read, None)
+
+        await asyncio.to_thread(walk_archive, fileobj, tally, report if progress else None)
+
+async def process_repo(repo_owner, repo_name, github=None, previous=None, mode=None, progress=None, metadata=None):
+    """
+    Build the stats entry for one repo.
+
+    `previous` is the entry stored by the last run. Its `sync` block holds the
+    head commit SHA and the ETags of the ref, tree and languages responses, which
+    are sent back as `If-None-Match`; when nothing changed GitHub answers 304 and
+    the stored `file_stats` are returned as they are.
+
+    `metadata` is this repo's entry from repo_metadata.fetch_metadata. With it,
+    the head commit and languages come from that batched query instead of two
+    REST calls here.
+
+    `mode` picks how lines are counted, "blobs" or "archive" (see COUNT_MODE).
+    `progress(stage, done, total)` is called as work advances, with `stage` one
+    of "checking", "tree", "blobs" or "archive"; `done`/`total` may be None.
+    """
+    # Reuse the caller's session when refreshing many repos, otherwise open one for this repo
+    if github is None:
+        async with GitHubClient() as github:
+            return await process_repo(repo_owner, repo_name, github, previous, mode, progress, metadata)
+
+    if progress is None:
+        def progress(stage, done, total):
+            pass
+    progress("checking", None, None)
+
+    sync = dict(previous.get("sync", {})) if previous else {}
+
+    if metadata is not None:
+        head_sha = metadata["head_sha"]
+        languages_data = metadata["languages"]
+        head_unchanged = head_sha == sync.get("head_sha")
+        languages_unchanged = languages_data == sync.get("languages")
+        sync.update({
+            "default_branch": metadata["default_branch"],
+            "head_sha": head_sha,
+            "languages": languages_data,
+        })
+    else:
+        (head_sha, ref_etag), (languages_data, languages_etag) = await asyncio.gather(
+            fetch_head_sha(github, repo_owner, repo_name, sync.get("ref_etag")),
+            fetch_language_bytes(github, repo_owner, repo_name, sync.get("languages_etag")),
+        )
+        # A 304 comes back as (None, etag); a failed lookup as (None, None)
+        head_unchanged = (head_sha is None and ref_etag is not None) or (head_sha is not None and head_sha == sync.get("head_sha"))
+        languages_unchanged = languages_data is None
+        if languages_unchanged:
+            languages_data = sync.get("languages", {})
+
+        sync.update({
+            "ref_etag": ref_etag,
+            "languages_etag": languages_etag,
+            "languages": languages_data,
+        })
+        if head_sha:
+            sync["head_sha"] = head_sha
+
+    if previous and "file_stats" in previous and head_unchanged and languages_unchanged:
+        return {**previous, "sync": sync}
+
+    archive = (mode or COUNT_MODE) == "archive"
+    # Archive counting adds lines as it reads, so it needs no per-file list
+    tally = RepoTally(DEFAULT_CLASSIFIER, keep_counted=not archive)
+    if archive:
+        # The archive listing stands in for the tree, so this is one request whatever the repo size
+        await count_lines_from_archive(github, repo_owner, repo_name, tally, sync.get("head_sha"), progress)
+    else:
+        # A new head can still point at an identical tree (e.g. an empty merge commit)
+        tree_etag = sync.get("tree_etag") if previous and languages_unchanged else None
+        progress("tree", None, None)
+        files, tree_etag = await fetch_files(github, repo_owner, repo_name, sync.get("head_sha", "HEAD"), tree_etag)
+        sync["tree_etag"] = tree_etag
+        if files is None:
+            return {**previous, "sync": sync}
+
+        # The tree is fetched once; each entry is classified once and shared with line counting
+        for file in files:
+            if file['type'] == 'blob':
+                tally.add_file(file)
+        line_counts = await count_lines_per_file(github, repo_owner, repo_name, [file for file, _ in tally.counted], progress=progress)
+        tally.add_line_counts(line_counts)
 
     repo_stats = {
-        "total_lines": total_lines,
-        "total_files": total_files,
-        "total_size": total_size
+        "total_lines": tally.total_lines,
+        "total_files": tally.total_files,
+        "total_size": sum(languages_data.values())
     }
 
     repo_breakdown = {}
-    for language, count in language_counts.items():
+    for language, totals in tally.languages.items():
         repo_breakdown[language.lower()] = {
             "name": language,
-            "count": count,
-            "lines": sum(line_counts[file] for file in line_counts if file.endswith(tuple(FILE_EXTENSIONS[language]))),
-            "size": languages_data.get(language, 0)
+            "count": totals["count"],
+            "lines": totals["lines"],
+            # GitHub's byte counts where it has them, otherwise the files' own sizes
+            "size": languages_data.get(language, totals["size"]),
+            # Kept apart from `size` so a push can add and remove files' sizes
+            "tree_size": totals["size"]
         }
 
     return {
@@ -131,7 +360,8 @@ def process_repo(repo_owner, repo_name):
         "file_stats": {
             "repo_stats": repo_stats,
             "repo_breakdown": repo_breakdown
-        }
+        },
+        "sync": sync
     }
 
 
@@ -142,57 +372,6 @@ def process_repo(repo_owner, repo_name):
 #     collection = db['github_stats']
 #     collection.insert_one(data)
 
-def insert_data_to_mongo(data):
-   # with open('global_stats.json') as f:
-       # data = json.load(f)
-    db = client['hackathon']
-    collection = db['global_stats']  #sure naming syntax can be changed
-    #or many 
-    collection.insert_many(data)
-
-#Need to test
-#Function for Repos 
-def add_repo_to_db(owner, repo_name, added_by, client):
-    db = client['hackathon']
-    collection = db['global_stats']
-    doc = collection.find_one()
-
-    if not doc:
-        return False  # No global_stats document exists
-
-    # Check if repo already exists in repo_array
-    for repo in doc.get("repo_array", []):
-        if repo["github_user"] == owner and repo["github_repo"] == repo_name:
-            return False  # Duplicate found
-
-    # Process the repo to attach file_stats
-    from file_count import process_repo  # import here to avoid circular import
-    try:
-        repo_data = process_repo(owner, repo_name)
-        repo_data["discord_user"] = added_by
-    except Exception as e:
-        print(f"Failed to process repo: {e}")
-        return False
-
-    # Push the new repo into the repo_array
-    collection.update_one(
-        {"_id": doc["_id"]},
-        {"$push": {"repo_array": repo_data}}
-    )
-
-    return True
-
-
-    
-def get_all_repos_from_global_stats(client):
-    db = client['hackathon']
-    collection = db['global_stats']
-    doc = collection.find_one()
-
-    if not doc or "repo_array" not in doc:
-        return []
-
-    return doc["repo_array"]
 
 
 #stays the same? 
@@ -202,40 +381,98 @@ def get_all_repos_from_global_stats(client):
 
     
 
-def main():
-    # Get all GitHub repos added via the bot
-    repos = get_all_repos_from_global_stats(client)
-
-    if not repos:
-        print("No repositories found in the database.")
-        return
-
-    global_stats = {
-        "total_lines": 0,
-        "total_files": 0,
-        "total_size": 0,
-        "languages": set()
-    }
-
-    repo_array = []
+async def refresh_repo(github, repo, mode=None, metadata=None):
+    """
+    Refresh and save one stored repo. Never raises; returns a result record with
+    `ok`, `error`, `duration` (seconds) and `api_calls`.
+    """
+    name = f"{repo['github_user']}/{repo['github_repo']}"
+    start = time.monotonic()
+    error = None
+    with track_calls() as calls:
+        try:
+            # Passing the stored entry lets unchanged repos short-circuit on 304s
+            repo_data = await process_repo(repo["github_user"], repo["github_repo"], github, previous=repo, mode=mode, metadata=metadata)
+            repo_data["discord_user"] = repo.get("discord_user", repo_data["discord_user"])
+            # Saved as soon as it is done, so a later failure cannot lose it
+            await repo_store.save_repo(repo_data)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
 
-    for repo in repos:
-        repo_data = process_repo(repo["github_user"], repo["github_repo"])
-        repo_array.append(repo_data)
-
-        global_stats["total_lines"] += repo_data["file_stats"]["repo_stats"]["total_lines"]
-        global_stats["total_files"] += repo_data["file_stats"]["repo_stats"]["total_files"]
-        global_stats["total_size"] += repo_data["file_stats"]["repo_stats"]["total_size"]
-        global_stats["languages"].update(repo_data["file_stats"]["repo_breakdown"].keys())
-
-    global_stats["languages"] = list(global_stats["languages"])
-
-    output_data = {
-        "global-stats": global_stats,
-        "repo_array": repo_array
+    return {
+        "repo": name,
+        "ok": error is None,
+        "error": error,
+        "duration": time.monotonic() - start,
+        "api_calls": calls.count,
     }
 
-    # Write directly to MongoDB
-    insert_data_to_mongo(output_data)
+async def refresh_all(concurrency=REFRESH_CONCURRENCY, mode=None):
+    """
+    Refresh every stored repo, `concurrency` at a time, and print a summary.
+    A failing repo is reported and does not stop the others.
+    """
+    repos = await repo_store.get_all_repos()
+    if not repos:
+        print("No repositories found in the database.")
+        return []
 
-    print("Stats successfully inserted into MongoDB.")
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.monotonic()
+
+    # One session for the whole refresh so connections are pooled across repos
+    async with GitHubClient() as github:
+        # Head commits and languages for every repo in a few GraphQL queries;
+        # repos missing from the result fall back to per-repo REST calls
+        keys = [(repo["github_user"], repo["github_repo"]) for repo in repos]
+        requests_before = github.request_count
+        metadata = await fetch_metadata(github, keys)
+        if metadata:
+            print(f"Fetched metadata for {len(metadata)}/{len(repos)} repos in {github.request_count - requests_before} GraphQL requests")
+
+        async def run(repo):
+            async with semaphore:
+                result = await refresh_repo(github, repo, mode, metadata.get((repo["github_user"], repo["github_repo"])))
+            status = "ok" if result["ok"] else f"FAILED ({result['error']})"
+            print(f"{result['repo']}: {status} in {result['duration']:.1f}s, {result['api_calls']} API calls")
+            return result
+
+        results = await asyncio.gather(*(run(repo) for repo in repos))
+
+    print_refresh_summary(results, time.monotonic() - start)
+    return results
+
+def print_refresh_summary(results, elapsed):
+    failed = [result for result in results if not result["ok"]]
+    api_calls = sum(result["api_calls"] for result in results)
+    print(
+        f"Refreshed {len(results) - len(failed)}/{len(results)} repos in {elapsed:.1f}s "
+        f"({len(results) / elapsed * 60:.1f} repos/min, {api_calls / len(results):.1f} API calls/repo)"
+    )
+    if failed:
+        print("Failed:")
+        for result in failed:
+            print(f"  {result['repo']}: {result['error']}")
+    slowest = max(results, key=lambda result: result["duration"])
+    print(f"Slowest: {slowest['repo']} ({slowest['duration']:.1f}s)")
+
+async def main(concurrency=REFRESH_CONCURRENCY, mode=None):
+    await refresh_all(concurrency, mode)
+
+    # Each save_repo already folded its change into the rollup
+    global_stats = await repo_store.get_global_stats()
+    print(f"Stats updated: {global_stats['total_lines']} lines in {global_stats['total_files']} files across {global_stats['repo_count']} repos.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the line/file stats of every registered repo.")
+    parser.add_argument("--concurrency", type=int, default=REFRESH_CONCURRENCY, help="repos refreshed at the same time")
+    parser.add_argument("--mode", choices=["blobs", "archive"], default=None, help="how lines are counted (default: COUNT_MODE)")
+    parser.add_argument("--rebuild-rollup", action="store_true",
+                        help="recompute the global stats rollup from the stored repos and exit")
+    args = parser.parse_args()
+    if args.rebuild_rollup:
+        rollup = asyncio.run(repo_store.rebuild_rollup())
+        print(f"Rebuilt the rollup: {rollup['total_lines']} lines in {rollup['total_files']} files across {rollup['repo_count']} repos.")
+    else:
+        asyncio.run(main(args.concurrency, args.mode))
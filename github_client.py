@@ -0,0 +1,167 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+import aiohttp
+from dotenv import load_dotenv
+
+import metrics
+from rate_limit import CORE, get_rate_limiter
+
+load_dotenv()
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+GITHUB_PAT = os.getenv("GITHUB_PAT")
+
+# How many GitHub requests may be on the wire at once, shared by every repo
+MAX_IN_FLIGHT = int(os.getenv("GITHUB_MAX_IN_FLIGHT", "20"))
+# Most requests must finish within 5 minutes; long downloads such as tarballs
+# only need to keep receiving data
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=300, sock_read=60)
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_read=60)
+
+
+metrics.Gauge(
+    "github_rate_limit_remaining", "REST requests left in the current GitHub rate-limit window",
+    function=lambda: get_rate_limiter().remaining,
+)
+
+
+# Set by track_calls() so requests made on behalf of one repo can be counted
+_call_counter = ContextVar("github_call_counter", default=None)
+
+
+class CallCounter:
+    def __init__(self):
+        self.count = 0
+
+
+@contextmanager
+def track_calls():
+    """
+    Count the GitHub requests made inside this block, including those made by
+    tasks it starts (they inherit the context).
+    """
+    counter = CallCounter()
+    token = _call_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _call_counter.reset(token)
+
+
+class GitHubError(Exception):
+    pass
+
+
+class RateLimitExceeded(GitHubError):
+    pass
+
+
+class RepoNotFound(GitHubError):
+    """GitHub answered 404: the repo does not exist or the token cannot see it."""
+
+
+class GitHubClient:
+    """
+    One pooled aiohttp session for all GitHub calls made during a refresh.
+
+    Use it as `async with GitHubClient() as github:` and pass it to the
+    functions in file_count so every repo shares the same connections and
+    the same limit on in-flight requests.
+    """
+
+    def __init__(self, token=GITHUB_PAT, max_in_flight=MAX_IN_FLIGHT, rate_limiter=None):
+        self.token = token
+        self.max_in_flight = max_in_flight
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.request_count = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=REQUEST_TIMEOUT,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    def get_headers(self, extra=None):
+        headers = {"Accept": "application/vnd.github+json"}
+        if self.token:
+            headers["Authorization"] = f"token {self.token}"
+        if extra:
+            headers.update(extra)
+        return headers
+
+    @asynccontextmanager
+    async def stream(self, path, headers=None, method="GET", json=None, timeout=None):
+        """
+        Open a request (GET unless `method` says otherwise) and hold an in-flight
+        slot until the body has been read. `timeout` replaces the session's
+        REQUEST_TIMEOUT, e.g. DOWNLOAD_TIMEOUT for large bodies.
+
+        Rate-limited responses are retried after the wait chosen by the shared
+        scheduler; RateLimitExceeded is raised only when the retries run out.
+        """
+        resource = "graphql" if path == "/graphql" else CORE
+        for attempt in range(self.rate_limiter.max_retries + 1):
+            await self.rate_limiter.acquire(resource)
+            async with self._semaphore:
+                self.request_count += 1
+                counter = _call_counter.get()
+                if counter is not None:
+                    counter.count += 1
+                async with self._session.request(method, GITHUB_API_URL + path, headers=self.get_headers(headers), json=json, timeout=timeout or REQUEST_TIMEOUT) as response:
+                    self.rate_limiter.observe(response.headers)
+                    metrics.GITHUB_REQUESTS.inc(status=response.status)
+                    body = await response.text() if response.status in (403, 429) else None
+                    delay = self.rate_limiter.retry_delay(response.status, response.headers, body, attempt)
+                    if delay is None:
+                        yield response
+                        return
+                    # A used-up primary budget only holds requests that spend from it
+                    used_up = response.headers.get("X-RateLimit-Remaining") == "0"
+
+            print(f"Rate limited on {path}, retrying in {delay:.1f}s")
+            self.rate_limiter.pause(delay, resource if used_up else None)
+
+        raise RateLimitExceeded(f"Gave up on {path} after {attempt + 1} rate-limited attempts")
+
+    async def get_conditional(self, path, etag=None, headers=None):
+        """
+        GET with `If-None-Match` and return `(status, data, etag)`.
+
+        A 304 means the resource is unchanged since `etag` was issued; GitHub
+        does not count it against the rate limit and `data` is None.
+        """
+        headers = dict(headers or {})
+        if etag:
+            headers["If-None-Match"] = etag
+        async with self.stream(path, headers) as response:
+            if response.status == 304:
+                return 304, None, etag
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, data, response.headers.get("ETag")
+
+    async def graphql(self, query, variables=None):
+        """
+        POST a GraphQL query and return `(status, data, errors)`. GitHub can
+        answer 200 with partial `data` and a list of `errors` (e.g. one
+        repository in the query not found).
+        """
+        async with self.stream("/graphql", method="POST", json={"query": query, "variables": variables or {}}) as response:
+            try:
+                body = await response.json(content_type=None)
+            except ValueError:
+                body = None
+            body = body or {}
+            return response.status, body.get("data"), body.get("errors")
@@ -0,0 +1,173 @@
+import re
+
+# <@123>, <@!123> (member mentions) and <@&123> (role mentions)
+MENTION = re.compile(r"^<@(!|&)?(\d+)>$")
+
+
+def _key(value):
+    return value.casefold() if value else None
+
+
+class _Index:
+    """
+    Case-insensitive name -> objects map. Several members can share a name;
+    the one indexed first is returned until it goes away.
+    """
+
+    def __init__(self):
+        self.items = {}
+
+    def add(self, name, obj):
+        key = _key(name)
+        if key is not None:
+            self.items.setdefault(key, {})[obj.id] = obj
+
+    def remove(self, name, obj):
+        key = _key(name)
+        owners = self.items.get(key)
+        if owners is not None:
+            owners.pop(obj.id, None)
+            if not owners:
+                del self.items[key]
+
+    def get(self, name):
+        owners = self.items.get(_key(name))
+        return next(iter(owners.values())) if owners else None
+
+
+class _GuildIndex:
+    def __init__(self, guild):
+        self.members_by_id = {}
+        self.members_by_name = _Index()
+        self.members_by_global_name = _Index()
+        self.members_by_nick = _Index()
+        self.roles_by_id = {}
+        self.roles_by_name = _Index()
+        for member in guild.members:
+            self.add_member(member)
+        for role in guild.roles:
+            self.add_role(role)
+
+    def add_member(self, member):
+        # Names are remembered as indexed, so they can be removed after the member object changes
+        self.members_by_id[member.id] = (member, member.name, member.global_name, member.nick)
+        self.members_by_name.add(member.name, member)
+        self.members_by_global_name.add(member.global_name, member)
+        self.members_by_nick.add(member.nick, member)
+
+    def remove_member(self, member):
+        entry = self.members_by_id.pop(member.id, None)
+        if entry is None:
+            return
+        _, name, global_name, nick = entry
+        self.members_by_name.remove(name, member)
+        self.members_by_global_name.remove(global_name, member)
+        self.members_by_nick.remove(nick, member)
+
+    def add_role(self, role):
+        self.roles_by_id[role.id] = (role, role.name)
+        self.roles_by_name.add(role.name, role)
+
+    def remove_role(self, role):
+        entry = self.roles_by_id.pop(role.id, None)
+        if entry is not None:
+            self.roles_by_name.remove(entry[1], role)
+
+    def find_member(self, identifier):
+        return (
+            self.members_by_name.get(identifier)
+            or self.members_by_global_name.get(identifier)
+            or self.members_by_nick.get(identifier)
+        )
+
+
+class GuildDirectory:
+    """
+    Per-guild index of members (by ID, username, global name and nickname) and
+    roles (by ID and name), so `lookup` is a few dict gets instead of a scan
+    of `guild.members`. A guild is indexed the first time it is looked up and
+    kept current by the member/role event handlers in the bot.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+
+    def _index(self, guild):
+        index = self._guilds.get(guild.id)
+        if index is None:
+            index = self._guilds[guild.id] = _GuildIndex(guild)
+        return index
+
+    def forget_guild(self, guild):
+        self._guilds.pop(guild.id, None)
+
+    def lookup(self, guild, identifier):
+        """
+        Resolve a user or role from a mention, an ID or a name (case-insensitive).
+        Returns `(target, 'user' | 'role')` or `(None, None)`; users win over roles.
+        """
+        index = self._index(guild)
+        identifier = identifier.strip()
+
+        mention = MENTION.match(identifier)
+        if mention:
+            kind, target_id = mention.group(1), int(mention.group(2))
+            if kind == '&':
+                entry = index.roles_by_id.get(target_id)
+                return (entry[0], 'role') if entry else (None, None)
+            entry = index.members_by_id.get(target_id)
+            return (entry[0], 'user') if entry else (None, None)
+
+        if identifier.isdigit():
+            entry = index.members_by_id.get(int(identifier))
+            if entry:
+                return entry[0], 'user'
+            entry = index.roles_by_id.get(int(identifier))
+            if entry:
+                return entry[0], 'role'
+
+        member = index.find_member(identifier)
+        if member:
+            return member, 'user'
+        role = index.roles_by_name.get(identifier)
+        if role:
+            return role, 'role'
+        return None, None
+
+    # Event hooks. Guilds that have not been looked up yet are skipped; they
+    # are indexed from the current cache on first use.
+
+    def member_added(self, member):
+        if member.guild.id in self._guilds:
+            self._guilds[member.guild.id].add_member(member)
+
+    def member_removed(self, member):
+        if member.guild.id in self._guilds:
+            self._guilds[member.guild.id].remove_member(member)
+
+    def member_updated(self, member):
+        if member.guild.id in self._guilds:
+            index = self._guilds[member.guild.id]
+            index.remove_member(member)
+            index.add_member(member)
+
+    def user_updated(self, user, guilds):
+        """A username/global name change applies to the user's member in every indexed guild."""
+        for guild in guilds:
+            member = guild.get_member(user.id)
+            if member is not None:
+                self.member_updated(member)
+
+    def role_added(self, role):
+        if role.guild.id in self._guilds:
+            self._guilds[role.guild.id].add_role(role)
+
+    def role_removed(self, role):
+        if role.guild.id in self._guilds:
+            self._guilds[role.guild.id].remove_role(role)
+
+    def role_updated(self, role):
+        if role.guild.id in self._guilds:
+            index = self._guilds[role.guild.id]
+            index.remove_role(role)
+            index.add_role(role)
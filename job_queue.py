@@ -0,0 +1,158 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+import db
+
+# How long a claimed job stays with its worker without a heartbeat
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Wait before retrying a failed job: this many seconds times the attempt number
+JOB_RETRY_BACKOFF_SECONDS = 30
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_ready = False
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def get_jobs_collection():
+    return db.get_collection('repo_jobs')
+
+
+async def ensure_ready():
+    """
+    Indexes for claiming jobs in order and for allowing one unfinished job per
+    key. `active` is set only while a job is queued or running, so finished
+    jobs do not block a new one for the same repo.
+    """
+    global _ready
+    if _ready:
+        return
+    jobs = get_jobs_collection()
+    await jobs.create_index([("key", 1)], unique=True, partialFilterExpression={"active": True})
+    await jobs.create_index([("status", 1), ("available_at", 1)])
+    await jobs.create_index([("status", 1), ("lease_expires_at", 1)])
+    _ready = True
+
+
+async def enqueue(kind, key, payload, max_attempts=JOB_MAX_ATTEMPTS):
+    """Add a job and return its ID, or None if `key` already has a job queued or running."""
+    await ensure_ready()
+    now = _now()
+    job = {
+        "kind": kind,
+        "key": key,
+        "payload": payload,
+        "status": QUEUED,
+        "active": True,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "created_at": now,
+        "available_at": now,
+        "updated_at": now,
+    }
+    try:
+        result = await get_jobs_collection().insert_one(job)
+    except DuplicateKeyError:
+        return None
+    return result.inserted_id
+
+
+async def claim(worker_id, lease_seconds=JOB_LEASE_SECONDS):
+    """
+    Take the oldest job that is ready to run, or one whose worker stopped
+    heartbeating, and lease it to `worker_id`. Returns the job or None.
+    """
+    await ensure_ready()
+    now = _now()
+    return await get_jobs_collection().find_one_and_update(
+        {"$or": [
+            {"status": QUEUED, "available_at": {"$lte": now}},
+            {"status": RUNNING, "lease_expires_at": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+        ]},
+        {
+            "$set": {
+                "status": RUNNING,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("available_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def heartbeat(job, worker_id, progress=None, lease_seconds=JOB_LEASE_SECONDS):
+    """Extend the lease and record progress. Returns False if the job is no longer ours."""
+    now = _now()
+    update = {"lease_expires_at": now + timedelta(seconds=lease_seconds), "updated_at": now}
+    if progress is not None:
+        update["progress"] = progress
+    result = await get_jobs_collection().update_one(
+        {"_id": job["_id"], "status": RUNNING, "lease_owner": worker_id, "attempts": job["attempts"]},
+        {"$set": update},
+    )
+    return result.matched_count == 1
+
+
+async def complete(job, worker_id, result=None):
+    now = _now()
+    await get_jobs_collection().update_one(
+        {"_id": job["_id"], "lease_owner": worker_id, "attempts": job["attempts"]},
+        {"$set": {"status": DONE, "result": result, "finished_at": now, "updated_at": now},
+         "$unset": {"active": "", "lease_owner": "", "lease_expires_at": ""}},
+    )
+
+
+async def fail(job, worker_id, error, retry=True):
+    """
+    Record a failed attempt. The job is queued again after a backoff until it
+    has used `max_attempts`, or not at all when `retry` is False; returns True
+    when it has failed for good.
+    """
+    now = _now()
+    final = not retry or job["attempts"] >= job["max_attempts"]
+    if final:
+        update = {"$set": {"status": FAILED, "error": error, "finished_at": now, "updated_at": now},
+                  "$unset": {"active": "", "lease_owner": "", "lease_expires_at": ""}}
+    else:
+        retry_at = now + timedelta(seconds=JOB_RETRY_BACKOFF_SECONDS * job["attempts"])
+        update = {"$set": {"status": QUEUED, "error": error, "available_at": retry_at, "updated_at": now},
+                  "$unset": {"lease_owner": "", "lease_expires_at": ""}}
+    await get_jobs_collection().update_one(
+        {"_id": job["_id"], "lease_owner": worker_id, "attempts": job["attempts"]},
+        update,
+    )
+    return final
+
+
+async def expire_abandoned():
+    """
+    Fail running jobs whose lease ran out on their last allowed attempt; the
+    others are picked up again by `claim`. Returns the jobs that were failed.
+    """
+    now = _now()
+    query = {"status": RUNNING, "lease_expires_at": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}}
+    abandoned = await get_jobs_collection().find(query).to_list(None)
+    for job in abandoned:
+        await get_jobs_collection().update_one(
+            {"_id": job["_id"], "status": RUNNING, "attempts": job["attempts"]},
+            {"$set": {"status": FAILED, "error": "worker stopped responding", "finished_at": now, "updated_at": now},
+             "$unset": {"active": "", "lease_owner": "", "lease_expires_at": ""}},
+        )
+    return abandoned
+
+
+async def get_jobs(job_ids):
+    return await get_jobs_collection().find({"_id": {"$in": list(job_ids)}}).to_list(None)
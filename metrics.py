@@ -0,0 +1,228 @@
+import asyncio
+import functools
+import os
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# Serve /metrics on this port; unset or 0 leaves instrumentation off
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ENABLED = METRICS_PORT > 0
+# How often the loop-lag monitor wakes up
+LOOP_LAG_INTERVAL = 0.5
+
+# Seconds; fine at the low end, where blocking calls on the event loop show up
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        if ENABLED:
+            key = self._key(labels)
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that is set directly, or read from `function` when scraped."""
+
+    kind = "gauge"
+
+    def __init__(self, name, description, labels=(), function=None):
+        super().__init__(name, description, labels)
+        self.function = function
+
+    def set(self, value, **labels):
+        if ENABLED:
+            self.values[self._key(labels)] = value
+
+    def render(self):
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception as e:
+                print(f"Could not read metric {self.name}: {e}")
+                value = None
+            self.values = {} if value is None else {(): value}
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        series = self.values.get(key)
+        if series is None:
+            # Per-bucket (not cumulative) counts, then sum and count
+            series = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_label_text(self.labels + ('le',), key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {series[-1]}")
+        return lines
+
+
+@contextmanager
+def _timer(histogram, labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def _no_timer():
+    yield
+
+
+def timed(histogram, **labels):
+    """`with timed(histogram, ...):` records how long the block took."""
+    return _timer(histogram, labels) if ENABLED else _no_timer()
+
+
+def timed_event(histogram):
+    """Decorator for event handlers: records each call's duration under `event=<function name>`."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with _timer(histogram, {"event": func.__name__}):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable(port):
+    """
+    Serve on `port` in this process instead of METRICS_PORT (0 turns metrics
+    off). Call it before anything is recorded or decorated.
+    """
+    global METRICS_PORT, ENABLED
+    METRICS_PORT = port
+    ENABLED = port > 0
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+COMMAND_LATENCY = Histogram("bot_command_duration_seconds", "Time to run a bot command", ["command", "outcome"])
+EVENT_LATENCY = Histogram("bot_event_duration_seconds", "Time spent in a Discord event handler", ["event"])
+JOB_LATENCY = Histogram("bot_scheduled_job_duration_seconds", "Time to run a scheduled message job", ["job"])
+LOOP_LAG = Histogram("bot_event_loop_lag_seconds", "How late the event loop ran a timer that should have fired immediately")
+GITHUB_REQUESTS = Counter("github_requests_total", "GitHub API responses by status", ["status"])
+MONGO_LATENCY = Histogram("mongo_command_duration_seconds", "MongoDB command round trips", ["command", "outcome"])
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    """Sleep `interval` over and over; any extra delay is time the loop spent blocked on something else."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+def mongo_listeners():
+    """Event listeners for the Mongo client; none when metrics are off."""
+    if not ENABLED:
+        return []
+    from pymongo import monitoring
+
+    class CommandTimer(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+        def failed(self, event):
+            MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
+    return [CommandTimer()]
+
+
+_server = None
+_lag_task = None
+
+
+async def start_server(host=METRICS_HOST, port=None):
+    """Serve /metrics from the running loop and start the lag monitor. Does nothing when metrics are off."""
+    global _server, _lag_task
+    if not ENABLED or _server is not None:
+        return
+    port = port or METRICS_PORT
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    _server = web.AppRunner(app)
+    await _server.setup()
+    await web.TCPSite(_server, host, port).start()
+    _lag_task = asyncio.create_task(monitor_loop_lag())
+    print(f"Serving metrics on http://{host}:{port}/metrics")
@@ -0,0 +1,158 @@
+import asyncio
+
+import repo_store
+from file_classifier import DEFAULT_CLASSIFIER
+from file_count import count_lines_per_file, fetch_language_bytes, refresh_repo
+from repo_metadata import fetch_blob_entries
+
+# A push webhook payload lists at most this many commits (the Events API's
+# limit of 20 does not apply); a push that fills the list may have touched
+# files we cannot see
+MAX_PAYLOAD_COMMITS = 2048
+
+
+def default_branch_pushes(payloads):
+    """The payloads that moved the default branch; tag pushes and other branches are dropped."""
+    return [
+        payload for payload in payloads
+        if payload.get("ref") == f"refs/heads/{payload['repository']['default_branch']}"
+        and not payload.get("deleted")
+    ]
+
+
+def chain_pushes(head_sha, payloads):
+    """
+    Order `payloads` into a chain starting at the stored `head_sha`, each push's
+    `before` being the previous one's `after`. Returns None when that is not
+    possible: a missed push, a force push, or a push with a truncated commit list.
+    """
+    # A redelivered push that is already applied ends at the stored head
+    by_before = {payload["before"]: payload for payload in payloads if payload["after"] != head_sha}
+    chain = []
+    current = head_sha
+    while current in by_before:
+        payload = by_before.pop(current)
+        if payload.get("forced") or len(payload.get("commits", [])) >= MAX_PAYLOAD_COMMITS:
+            return None
+        chain.append(payload)
+        current = payload["after"]
+    if by_before:
+        return None
+    return chain
+
+
+def touched_paths(chain):
+    paths = set()
+    for payload in chain:
+        for commit in payload.get("commits", []):
+            for key in ("added", "modified", "removed"):
+                paths.update(commit.get(key, []))
+    return paths
+
+
+def apply_file_changes(file_stats, changes, languages_data, classifier=DEFAULT_CLASSIFIER):
+    """
+    New `file_stats` after replacing some files. `changes` is a list of
+    `(path, old, new)` where `old`/`new` are `(size, lines)` or None if the file
+    did not exist; `lines` is None for files that are not line-counted. Each
+    file contributes exactly what RepoTally would give it in a full scan.
+
+    File sizes go into each language's `tree_size`; `size` is then GitHub's
+    byte count when it has one and `tree_size` otherwise, as in process_repo.
+    """
+    repo_stats = dict(file_stats.get("repo_stats", {}))
+    breakdown = {key: dict(totals) for key, totals in file_stats.get("repo_breakdown", {}).items()}
+
+    for path, old, new in changes:
+        language, counted = classifier.classify(path)
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None:
+                continue
+            size, lines = state
+            totals = None
+            if language is not None:
+                totals = breakdown.setdefault(language.lower(), {"name": language, "count": 0, "lines": 0, "tree_size": 0})
+                totals["count"] += sign
+                totals["tree_size"] += sign * size
+            if counted and lines is not None:
+                repo_stats["total_lines"] = repo_stats.get("total_lines", 0) + sign * lines
+                repo_stats["total_files"] = repo_stats.get("total_files", 0) + sign
+                if totals is not None:
+                    totals["lines"] += sign * lines
+
+    breakdown = {key: totals for key, totals in breakdown.items() if totals["count"] > 0}
+    for totals in breakdown.values():
+        totals["size"] = languages_data.get(totals["name"], totals["tree_size"])
+    repo_stats["total_size"] = sum(languages_data.values())
+    return {"repo_stats": repo_stats, "repo_breakdown": breakdown}
+
+
+async def file_states(github, owner, repo_name, commit, paths):
+    """`{path: (size, lines)}` for the paths that are files at `commit`; lines come from the blob cache when possible."""
+    entries = await fetch_blob_entries(github, owner, repo_name, [f"{commit}:{path}" for path in paths])
+    files = []
+    for path in paths:
+        entry = entries.get(f"{commit}:{path}")
+        if entry is not None:
+            files.append({"path": path, **entry})
+    counted = [file for file in files if DEFAULT_CLASSIFIER.classify(file["path"])[1]]
+    line_counts = await count_lines_per_file(github, owner, repo_name, counted)
+    return {file["path"]: (file["size"], line_counts.get(file["path"])) for file in files}
+
+
+async def apply_pushes(github, owner, repo_name, payloads):
+    """
+    Bring one stored repo up to date with a batch of push payloads.
+
+    When the pushes chain on from the stored head commit, only the files they
+    touched are looked up and re-counted, which costs a few requests however
+    big the repo is. Anything else (a missed or forced push, a truncated
+    payload, stats stored without per-language tree sizes) falls back to a
+    full refresh. Returns "updated", "refreshed" or "ignored".
+    """
+    pushes = default_branch_pushes(payloads)
+    if not pushes:
+        return "ignored"
+    repo = await repo_store.get_repo(owner, repo_name)
+    if repo is None or "file_stats" not in repo:
+        # Not registered, or still being added; add_repo will count the latest commit
+        return "ignored"
+
+    sync = dict(repo.get("sync", {}))
+    chain = chain_pushes(sync.get("head_sha"), pushes)
+    if chain == []:
+        return "ignored"
+    has_tree_sizes = all("tree_size" in totals for totals in repo["file_stats"].get("repo_breakdown", {}).values())
+    if chain is None or not github.token or not has_tree_sizes:
+        result = await refresh_repo(github, repo)
+        if not result["ok"]:
+            raise RuntimeError(result["error"])
+        return "refreshed"
+
+    before, after = chain[0]["before"], chain[-1]["after"]
+    paths = sorted(touched_paths(chain))
+    (old_states, new_states), (languages_data, languages_etag) = await asyncio.gather(
+        asyncio.gather(
+            file_states(github, owner, repo_name, before, paths),
+            file_states(github, owner, repo_name, after, paths),
+        ),
+        fetch_language_bytes(github, owner, repo_name, sync.get("languages_etag")),
+    )
+    if languages_data is None:
+        languages_data = sync.get("languages", {})
+
+    changes = [(path, old_states.get(path), new_states.get(path)) for path in paths]
+    sync.update({
+        "head_sha": after,
+        "languages": languages_data,
+        "languages_etag": languages_etag,
+        # Both describe the old head; the next poll asks again
+        "ref_etag": None,
+        "tree_etag": None,
+    })
+    await repo_store.save_repo({
+        **repo,
+        "file_stats": apply_file_changes(repo["file_stats"], changes, languages_data),
+        "sync": sync,
+    })
+    return "updated"
@@ -0,0 +1,133 @@
+import asyncio
+import random
+import time
+
+# Retries for one request before giving up; waits for the hourly reset count as one
+MAX_RETRIES = 8
+# Backoff for secondary limits without a Retry-After: base * 2**attempt, capped, with full jitter
+BASE_BACKOFF = 2.0
+MAX_BACKOFF = 120.0
+
+
+# The REST budget; GraphQL ("graphql"), search and others are counted separately
+CORE = "core"
+
+
+class RateLimitBudget:
+    """What the last responses said about one `X-RateLimit-Resource`."""
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None  # unknown until the first response
+        self.reset_at = 0.0
+        self.paused_until = 0.0
+
+
+class RateLimitScheduler:
+    """
+    Budget of GitHub API calls shared by every request in the process.
+
+    `acquire()` is awaited before each request. It spends one call from the
+    budget last reported in `X-RateLimit-Remaining`, and once that reaches
+    zero it holds every caller until `X-RateLimit-Reset`. GitHub keeps a
+    separate budget per `X-RateLimit-Resource` (REST is "core", GraphQL is
+    "graphql"), and so does the scheduler. Secondary rate limits pause all
+    queued work for `Retry-After` or a jittered backoff, after which the
+    request is retried.
+    """
+
+    def __init__(self, max_retries=MAX_RETRIES, base_backoff=BASE_BACKOFF, max_backoff=MAX_BACKOFF):
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.budgets = {}
+        self.paused_until = 0.0
+
+    def budget(self, resource=CORE):
+        if resource not in self.budgets:
+            self.budgets[resource] = RateLimitBudget()
+        return self.budgets[resource]
+
+    @property
+    def remaining(self):
+        """Calls left in the REST budget, or None if not known yet."""
+        return self.budget(CORE).remaining
+
+    async def acquire(self, resource=CORE):
+        budget = self.budget(resource)
+        while True:
+            now = time.time()
+            paused_until = max(self.paused_until, budget.paused_until)
+            if now < paused_until:
+                await asyncio.sleep(paused_until - now)
+                continue
+
+            if budget.remaining is None or budget.remaining > 0:
+                if budget.remaining is not None:
+                    budget.remaining -= 1
+                return
+
+            if now < budget.reset_at:
+                print(f"GitHub {resource} rate limit used up, pausing until {time.strftime('%H:%M:%S', time.localtime(budget.reset_at))}")
+                self.pause(budget.reset_at - now + 1, resource)
+            else:
+                # The window has rolled over; let the next response tell us the new budget
+                budget.remaining = None
+
+    def pause(self, seconds, resource=None):
+        """Hold requests for `seconds`: those spending `resource`, or all of them when it is None."""
+        if resource is None:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+        else:
+            budget = self.budget(resource)
+            budget.paused_until = max(budget.paused_until, time.time() + seconds)
+
+    def observe(self, headers):
+        """Update the budget named by `X-RateLimit-Resource` from a response's `X-RateLimit-*` headers."""
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        budget = self.budget(headers.get("X-RateLimit-Resource", CORE))
+        remaining, reset = int(remaining), float(reset)
+        if headers.get("X-RateLimit-Limit"):
+            budget.limit = int(headers["X-RateLimit-Limit"])
+
+        if reset > budget.reset_at:
+            # A new window: the header is the authority
+            budget.reset_at = reset
+            budget.remaining = remaining
+        elif budget.remaining is None or remaining < budget.remaining:
+            # Responses can arrive out of order; never raise the budget within a window
+            budget.remaining = remaining
+
+    def retry_delay(self, status, headers, body, attempt):
+        """
+        Return how long to wait before retrying, or None if the response is not rate limited.
+        """
+        if status not in (403, 429):
+            return None
+
+        retry_after = headers.get("Retry-After")
+        if retry_after is not None:
+            return float(retry_after)
+
+        if headers.get("X-RateLimit-Remaining") == "0":
+            return max(float(headers.get("X-RateLimit-Reset", 0)) - time.time(), 0) + 1
+
+        if status == 429 or "rate limit" in (body or "").lower():
+            # Secondary limit without a hint: exponential backoff with full jitter
+            return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)) + 1
+
+        return None
+
+
+_scheduler = None
+
+
+def get_rate_limiter():
+    """The scheduler shared by every GitHubClient in this process."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RateLimitScheduler()
+    return _scheduler
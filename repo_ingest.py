@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+# Discord allows roughly 5 edits per 5 seconds on a channel
+PROGRESS_EDIT_INTERVAL = 2.0
+
+
+class ProgressMessage:
+    """
+    Keeps a Discord message showing a job's latest progress.
+
+    `update()` can be called as often as needed (it is a plain function so it
+    can be passed as process_repo's `progress` callback); edits are coalesced
+    to one per PROGRESS_EDIT_INTERVAL.
+    """
+
+    def __init__(self, message, label, interval=PROGRESS_EDIT_INTERVAL):
+        self.message = message
+        self.label = label
+        self.interval = interval
+        self.text = None
+        self._last_edit = 0.0
+        self._flush_task = None
+
+    def update(self, stage, done=None, total=None):
+        if stage == "blobs" and total:
+            text = f"{self.label}: counting lines ({done}/{total} files)"
+        elif stage == "archive":
+            text = f"{self.label}: reading archive ({done} files)"
+        elif stage == "tree":
+            text = f"{self.label}: fetching file tree"
+        elif stage == "checking":
+            text = f"{self.label}: checking the latest commit"
+        else:
+            text = f"{self.label}: {stage}"
+        # Progress polled from a job repeats itself; only changes are worth an edit
+        if text == self.text:
+            return
+        self.text = text
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        delay = self._last_edit + self.interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit(content=self.text)
+        except Exception as e:
+            print(f"Could not update progress message: {e}")
+
+    async def finish(self, text):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+        await self.message.edit(content=text)
@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+from github_client import GitHubError
+
+# Repositories per GraphQL query. Each asks for up to 100 languages, so 50
+# repos is 5,000 nodes, far below GitHub's 500,000 node limit per query.
+METADATA_BATCH_SIZE = int(os.getenv("METADATA_BATCH_SIZE", "50"))
+
+_REPO_FIELDS = """
+    defaultBranchRef { name target { oid } }
+    languages(first: 100, orderBy: {field: SIZE, direction: DESC}) { edges { size node { name } } }
+"""
+
+
+def build_query(count):
+    """One query with an aliased `repository` lookup per repo: r0, r1, ..."""
+    params = ", ".join(f"$o{i}: String!, $n{i}: String!" for i in range(count))
+    lookups = "\n".join(
+        f"  r{i}: repository(owner: $o{i}, name: $n{i}) {{{_REPO_FIELDS}  }}" for i in range(count)
+    )
+    return f"query({params}) {{\n{lookups}\n  rateLimit {{ cost remaining }}\n}}"
+
+
+def _parse_repository(node):
+    if not node or not node.get("defaultBranchRef"):
+        # Not found, no access, or an empty repo with no commits yet
+        return None
+    branch = node["defaultBranchRef"]
+    return {
+        "default_branch": branch["name"],
+        "head_sha": branch["target"]["oid"],
+        # Same shape as the REST /languages response: {language: bytes}
+        "languages": {edge["node"]["name"]: edge["size"] for edge in node["languages"]["edges"]},
+    }
+
+
+async def fetch_metadata_batch(github, repos):
+    """
+    Default branch, head commit and language bytes for `repos`, a list of
+    `(owner, name)`, in one GraphQL request. Repos GitHub could not resolve
+    are left out of the result, as is the whole batch if the request fails.
+    """
+    variables = {}
+    for i, (owner, name) in enumerate(repos):
+        variables[f"o{i}"] = owner
+        variables[f"n{i}"] = name
+
+    status, data, errors = await github.graphql(build_query(len(repos)), variables)
+    if status != 200 or data is None:
+        print(f"Metadata query for {len(repos)} repos failed with status {status}: {errors}")
+        return {}
+    for error in errors or []:
+        print(f"Metadata query: {error.get('message')}")
+
+    metadata = {}
+    for i, repo in enumerate(repos):
+        parsed = _parse_repository(data.get(f"r{i}"))
+        if parsed is not None:
+            metadata[repo] = parsed
+    return metadata
+
+
+async def fetch_metadata(github, repos, batch_size=METADATA_BATCH_SIZE):
+    """
+    Metadata for every repo in `repos`, batch_size repos per GraphQL query,
+    as `{(owner, name): {"default_branch", "head_sha", "languages"}}`.
+
+    GraphQL needs a token; without one this returns {} and callers fall back
+    to the per-repo REST calls.
+    """
+    if not github.token or not repos:
+        return {}
+    repos = list(repos)
+    batches = [repos[start:start + batch_size] for start in range(0, len(repos), batch_size)]
+    metadata = {}
+    results = await asyncio.gather(*(fetch_metadata_batch(github, batch) for batch in batches), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            # Those repos fall back to REST like any other repo missing from the result
+            print(f"Metadata batch failed: {type(result).__name__}: {result}")
+        else:
+            metadata.update(result)
+    return metadata
+
+
+# Blob lookups per GraphQL query when reading individual files at a commit
+BLOB_BATCH_SIZE = 100
+
+
+async def fetch_blob_entries(github, owner, name, expressions, batch_size=BLOB_BATCH_SIZE):
+    """
+    Look up files at given commits, with `expressions` like "<commit>:<path>".
+    Returns `{expression: {"sha": ..., "size": ...}}` for the ones that are
+    files there; paths that do not exist at that commit (or are directories or
+    submodules) are left out.
+    """
+    expressions = list(expressions)
+    entries = {}
+    for start in range(0, len(expressions), batch_size):
+        batch = expressions[start:start + batch_size]
+        params = ", ".join(f"$e{i}: String!" for i in range(len(batch)))
+        lookups = "\n".join(f"    f{i}: object(expression: $e{i}) {{ ... on Blob {{ oid byteSize }} }}" for i in range(len(batch)))
+        query = f"query($owner: String!, $name: String!, {params}) {{\n  repository(owner: $owner, name: $name) {{\n{lookups}\n  }}\n}}"
+        variables = {"owner": owner, "name": name}
+        variables.update({f"e{i}": expression for i, expression in enumerate(batch)})
+
+        status, data, errors = await github.graphql(query, variables)
+        repository = (data or {}).get("repository")
+        if status != 200 or repository is None:
+            raise GitHubError(f"Looking up files in {owner}/{name} failed with status {status}: {errors}")
+        for i, expression in enumerate(batch):
+            node = repository.get(f"f{i}")
+            if node and "oid" in node:
+                entries[expression] = {"sha": node["oid"], "size": node["byteSize"]}
+    return entries
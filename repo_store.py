@@ -0,0 +1,252 @@
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+import db
+
+_ready = False
+_ready_lock = asyncio.Lock()
+# Mongo's error code for dropping an index that does not exist
+INDEX_NOT_FOUND = 27
+
+
+# The rollup lives beside the old summary document in global_stats
+ROLLUP_ID = "rollup"
+# GitHub owner and repo names are case-insensitive, so Foo/Bar and foo/bar are
+# the same repo; every lookup by name uses this collation to match the index
+NAME_COLLATION = {"locale": "en", "strength": 2}
+REPO_INDEX = "github_user_1_github_repo_1"
+
+
+def get_repos_collection():
+    return db.get_collection('repos')
+
+
+def get_rollup_collection():
+    return db.get_collection('global_stats')
+
+
+async def ensure_ready():
+    """
+    Create the indexes and move any repos still in the old `repo_array`
+    into their own documents. Runs once per process.
+    """
+    global _ready
+    if _ready:
+        return
+    # Concurrent first calls wait here instead of each migrating and rebuilding
+    async with _ready_lock:
+        if _ready:
+            return
+        repos = get_repos_collection()
+        # Replace the case-sensitive index the first releases created
+        existing = (await repos.index_information()).get(REPO_INDEX)
+        if existing is not None and "collation" not in existing:
+            try:
+                await repos.drop_index(REPO_INDEX)
+            except OperationFailure as e:
+                # Another process dropped it first
+                if e.code != INDEX_NOT_FOUND:
+                    raise
+        await repos.create_index(
+            [("github_user", 1), ("github_repo", 1)], name=REPO_INDEX, unique=True, collation=NAME_COLLATION,
+        )
+        await repos.create_index([("file_stats.repo_stats.total_lines", -1)])
+        await migrate_global_stats()
+        if not await get_rollup_collection().find_one({"_id": ROLLUP_ID}, {"_id": 1}):
+            await rebuild_rollup()
+        _ready = True
+
+
+async def migrate_global_stats():
+    """
+    One-time move from the single `global_stats` document, which held every
+    repo in `repo_array`, to one document per repo. Safe to run again.
+    """
+    global_stats = db.get_collection('global_stats')
+    doc = await global_stats.find_one({"repo_array": {"$exists": True}})
+    if not doc:
+        return
+
+    repos = get_repos_collection()
+    for repo in doc["repo_array"]:
+        key = {"github_user": repo["github_user"], "github_repo": repo["github_repo"]}
+        await repos.update_one(key, {"$setOnInsert": repo}, upsert=True, collation=NAME_COLLATION)
+
+    await global_stats.update_one({"_id": doc["_id"]}, {"$unset": {"repo_array": ""}})
+    print(f"Moved {len(doc['repo_array'])} repos out of global_stats.repo_array")
+
+
+async def reserve_repo(owner, repo_name, added_by):
+    """
+    Claim a repo before it is processed. Returns False if it is already stored;
+    the unique index makes this atomic even when two people add it at once.
+    """
+    await ensure_ready()
+    key = {"github_user": owner, "github_repo": repo_name}
+    try:
+        result = await get_repos_collection().update_one(
+            key,
+            {"$setOnInsert": {"discord_user": added_by, "added_at": datetime.now(timezone.utc)}},
+            upsert=True,
+            collation=NAME_COLLATION,
+        )
+    except DuplicateKeyError:
+        return False
+    return result.upserted_id is not None
+
+
+def stats_delta(old_stats, new_stats):
+    """
+    The `$inc` / `$set` update that turns a rollup including `old_stats` into one
+    including `new_stats`. Either side may be None (repo added or removed).
+    """
+    old_stats = old_stats or {}
+    new_stats = new_stats or {}
+    inc = {}
+    for field in ("total_lines", "total_files", "total_size"):
+        change = new_stats.get("repo_stats", {}).get(field, 0) - old_stats.get("repo_stats", {}).get(field, 0)
+        if change:
+            inc[field] = change
+
+    old_languages = old_stats.get("repo_breakdown", {})
+    new_languages = new_stats.get("repo_breakdown", {})
+    names = {}
+    for key in old_languages.keys() | new_languages.keys():
+        old = old_languages.get(key, {})
+        new = new_languages.get(key, {})
+        for field in ("count", "lines", "size"):
+            change = new.get(field, 0) - old.get(field, 0)
+            if change:
+                inc[f"languages.{key}.{field}"] = change
+        # Per-language repo counts tell us when a language has left the event entirely
+        repos = (key in new_languages) - (key in old_languages)
+        if repos:
+            inc[f"languages.{key}.repos"] = repos
+        if key in new_languages:
+            names[f"languages.{key}.name"] = new.get("name", key)
+
+    if not inc:
+        return None
+    return {"$inc": inc, "$set": names} if names else {"$inc": inc}
+
+
+async def apply_delta(old_stats, new_stats, repo_count_change=0):
+    update = stats_delta(old_stats, new_stats)
+    if repo_count_change:
+        update = update or {"$inc": {}}
+        update["$inc"]["repo_count"] = repo_count_change
+    if update:
+        await get_rollup_collection().update_one({"_id": ROLLUP_ID}, update, upsert=True)
+
+
+async def remove_repo(owner, repo_name):
+    old = await get_repos_collection().find_one_and_delete(
+        {"github_user": owner, "github_repo": repo_name}, collation=NAME_COLLATION,
+    )
+    if old and "file_stats" in old:
+        await apply_delta(old["file_stats"], None, -1)
+
+
+async def save_repo(repo_data):
+    """
+    Store a `process_repo` result on its repo's document and fold the change
+    into the rollup. The previous `file_stats` come back from the same atomic
+    update, so the delta is right even if the repo is saved from two places.
+    """
+    await ensure_ready()
+    fields = {key: value for key, value in repo_data.items() if key != "_id"}
+    old = await get_repos_collection().find_one_and_update(
+        {"github_user": repo_data["github_user"], "github_repo": repo_data["github_repo"]},
+        {"$set": fields},
+        projection={"file_stats": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+        collation=NAME_COLLATION,
+    )
+    old_stats = old.get("file_stats") if old else None
+    await apply_delta(old_stats, repo_data.get("file_stats"), 0 if old_stats else 1)
+
+
+async def get_repo(owner, repo_name):
+    await ensure_ready()
+    return await get_repos_collection().find_one({"github_user": owner, "github_repo": repo_name}, collation=NAME_COLLATION)
+
+
+async def get_all_repos():
+    await ensure_ready()
+    return await get_repos_collection().find().to_list(None)
+
+
+async def get_top_repos(limit=5):
+    """The `limit` largest repos by total lines, with just the fields a leaderboard needs."""
+    await ensure_ready()
+    cursor = get_repos_collection().find(
+        {"file_stats": {"$exists": True}},
+        {"_id": 0, "github_user": 1, "github_repo": 1, "discord_user": 1, "file_stats.repo_stats": 1},
+    ).sort("file_stats.repo_stats.total_lines", -1).limit(limit)
+    return await cursor.to_list(None)
+
+
+async def get_global_stats():
+    """
+    Totals over every stored repo, read from the rollup document.
+
+    `languages` lists the languages at least one repo still uses;
+    `language_totals` has their count, lines, size and number of repos.
+    """
+    await ensure_ready()
+    rollup = await get_rollup_collection().find_one({"_id": ROLLUP_ID}) or {}
+    language_totals = {key: totals for key, totals in rollup.get("languages", {}).items() if totals.get("repos", 0) > 0}
+    return {
+        "total_lines": rollup.get("total_lines", 0),
+        "total_files": rollup.get("total_files", 0),
+        "total_size": rollup.get("total_size", 0),
+        "repo_count": rollup.get("repo_count", 0),
+        "languages": list(language_totals),
+        "language_totals": language_totals,
+    }
+
+
+async def rebuild_rollup():
+    """Recompute the rollup from every repo document, e.g. to seed it or after manual edits."""
+    pipeline = [
+        {"$match": {"file_stats": {"$exists": True}}},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "total_lines": {"$sum": "$file_stats.repo_stats.total_lines"},
+                    "total_files": {"$sum": "$file_stats.repo_stats.total_files"},
+                    "total_size": {"$sum": "$file_stats.repo_stats.total_size"},
+                    "repo_count": {"$sum": 1},
+                }},
+            ],
+            "languages": [
+                {"$project": {"language": {"$objectToArray": "$file_stats.repo_breakdown"}}},
+                {"$unwind": "$language"},
+                {"$group": {
+                    "_id": "$language.k",
+                    "name": {"$first": "$language.v.name"},
+                    "count": {"$sum": "$language.v.count"},
+                    "lines": {"$sum": "$language.v.lines"},
+                    "size": {"$sum": "$language.v.size"},
+                    "repos": {"$sum": 1},
+                }},
+            ],
+        }},
+    ]
+    cursor = await get_repos_collection().aggregate(pipeline)
+    result = (await cursor.to_list(None))[0]
+    totals = result["totals"][0] if result["totals"] else {}
+    rollup = {
+        "total_lines": totals.get("total_lines", 0),
+        "total_files": totals.get("total_files", 0),
+        "total_size": totals.get("total_size", 0),
+        "repo_count": totals.get("repo_count", 0),
+        "languages": {language.pop("_id"): language for language in result["languages"]},
+    }
+    await get_rollup_collection().replace_one({"_id": ROLLUP_ID}, rollup, upsert=True)
+    return rollup
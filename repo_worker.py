@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import os
+import socket
+import uuid
+
+import job_queue
+import metrics
+import repo_store
+from file_count import process_repo, refresh_repo
+from github_client import GitHubClient, RepoNotFound
+from repo_metadata import fetch_metadata
+
+# Jobs one worker process runs at the same time
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "3"))
+# How often an idle worker checks for new jobs
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", "2"))
+# Where a worker serves /metrics; separate from the bot's METRICS_PORT so both
+# can share a .env. Give each worker on one machine its own with --metrics-port
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT") or 0)
+
+ADD_REPO = "add_repo"
+REFRESH_REPO = "refresh_repo"
+
+# Errors a retry cannot fix; jobs that raise these fail on the first attempt
+PERMANENT_ERRORS = (RepoNotFound,)
+
+
+def repo_key(owner, repo_name):
+    return f"{owner.lower()}/{repo_name.lower()}"
+
+
+async def enqueue_add_repo(owner, repo_name, added_by):
+    """Called by the bot. Returns the job ID, or None if the repo already has a job in progress."""
+    return await job_queue.enqueue(ADD_REPO, repo_key(owner, repo_name), {
+        "owner": owner,
+        "repo_name": repo_name,
+        "added_by": added_by,
+    })
+
+
+async def enqueue_refresh_all():
+    """
+    Queue a refresh of every stored repo. Head commits and languages are
+    looked up here in a few batched GraphQL queries and handed to the jobs.
+    """
+    repos = await repo_store.get_all_repos()
+    async with GitHubClient() as github:
+        metadata = await fetch_metadata(github, [(repo["github_user"], repo["github_repo"]) for repo in repos])
+    queued = 0
+    for repo in repos:
+        owner, repo_name = repo["github_user"], repo["github_repo"]
+        job_id = await job_queue.enqueue(REFRESH_REPO, repo_key(owner, repo_name), {
+            "owner": owner,
+            "repo_name": repo_name,
+            "metadata": metadata.get((owner, repo_name)),
+        })
+        queued += job_id is not None
+    print(f"Queued {queued} refresh jobs ({len(repos) - queued} repos already had one pending)")
+    return queued
+
+
+async def run_add_repo(github, job, progress):
+    payload = job["payload"]
+    owner, repo_name = payload["owner"], payload["repo_name"]
+    existing = await repo_store.get_repo(owner, repo_name)
+    retry = job["attempts"] > 1
+    if retry and existing is not None and "file_stats" in existing and existing.get("discord_user") == payload["added_by"]:
+        # An earlier attempt saved the repo but could not record that it was done
+        return {"added": True, "total_lines": existing["file_stats"]["repo_stats"]["total_lines"]}
+    # On a retry the document without file_stats is our own earlier reservation
+    if existing is not None and ("file_stats" in existing or not retry):
+        return {"added": False, "reason": "duplicate"}
+    if existing is None and not await repo_store.reserve_repo(owner, repo_name, payload["added_by"]):
+        return {"added": False, "reason": "duplicate"}
+
+    repo_data = await process_repo(owner, repo_name, github, progress=progress)
+    repo_data["discord_user"] = payload["added_by"]
+    await repo_store.save_repo(repo_data)
+    return {"added": True, "total_lines": repo_data["file_stats"]["repo_stats"]["total_lines"]}
+
+
+async def run_refresh_repo(github, job, progress):
+    payload = job["payload"]
+    repo = await repo_store.get_repo(payload["owner"], payload["repo_name"])
+    if repo is None:
+        return {"refreshed": False, "reason": "removed"}
+    result = await refresh_repo(github, repo, metadata=payload.get("metadata"))
+    if not result["ok"]:
+        raise RuntimeError(result["error"])
+    return {"refreshed": True, "api_calls": result["api_calls"]}
+
+
+HANDLERS = {
+    ADD_REPO: run_add_repo,
+    REFRESH_REPO: run_refresh_repo,
+}
+
+
+async def give_up(job):
+    """Undo what a job leaves behind once it has failed for good."""
+    if job["kind"] == ADD_REPO:
+        payload = job["payload"]
+        repo = await repo_store.get_repo(payload["owner"], payload["repo_name"])
+        if repo is not None and "file_stats" not in repo:
+            await repo_store.remove_repo(payload["owner"], payload["repo_name"])
+
+
+class Worker:
+    """
+    Takes jobs from the Mongo queue and runs them, `concurrency` at a time.
+    Any number of these can run, in any number of processes or machines;
+    each job is leased to one worker and kept alive by heartbeats, and a job
+    whose worker dies is picked up again once its lease runs out.
+    """
+
+    def __init__(self, concurrency=WORKER_CONCURRENCY, lease_seconds=job_queue.JOB_LEASE_SECONDS):
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def run(self):
+        print(f"Worker {self.worker_id} started, running up to {self.concurrency} jobs")
+        await metrics.start_server()
+        async with GitHubClient() as github:
+            await asyncio.gather(self._reap(), *(self._slot(github) for _ in range(self.concurrency)))
+
+    async def _slot(self, github):
+        # A Mongo or network error costs one poll or one job, never the slot
+        while True:
+            try:
+                job = await job_queue.claim(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                print(f"Could not claim a job: {type(e).__name__}: {e}")
+                await asyncio.sleep(WORKER_POLL_SECONDS)
+                continue
+            if job is None:
+                await asyncio.sleep(WORKER_POLL_SECONDS)
+                continue
+            try:
+                await self._run_job(github, job)
+            except Exception as e:
+                # The lease runs out and the job is claimed again
+                print(f"Could not record the outcome of job {job['_id']} ({job['key']}): {type(e).__name__}: {e}")
+
+    async def _reap(self):
+        while True:
+            try:
+                for job in await job_queue.expire_abandoned():
+                    print(f"Job {job['_id']} ({job['key']}) failed: its worker stopped responding")
+                    await give_up(job)
+            except Exception as e:
+                print(f"Could not expire abandoned jobs: {type(e).__name__}: {e}")
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _run_job(self, github, job):
+        latest = {}
+
+        def progress(stage, done=None, total=None):
+            latest["progress"] = {"stage": stage, "done": done, "total": total}
+
+        task = asyncio.create_task(HANDLERS[job["kind"]](github, job, progress))
+        try:
+            # Heartbeat often enough that two can be missed before the lease runs out
+            while not task.done():
+                await asyncio.wait([task], timeout=self.lease_seconds / 3)
+                if task.done():
+                    break
+                try:
+                    ours = await job_queue.heartbeat(job, self.worker_id, latest.get("progress"), self.lease_seconds)
+                except Exception as e:
+                    print(f"Heartbeat for job {job['_id']} ({job['key']}) failed, will try again: {type(e).__name__}: {e}")
+                    continue
+                if not ours:
+                    print(f"Lost the lease on job {job['_id']} ({job['key']}), stopping it")
+                    return
+        finally:
+            if not task.done():
+                task.cancel()
+
+        try:
+            result = task.result()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"Job {job['_id']} ({job['key']}) attempt {job['attempts']} failed: {error}")
+            if await job_queue.fail(job, self.worker_id, error, retry=not isinstance(e, PERMANENT_ERRORS)):
+                await give_up(job)
+            return
+        await job_queue.complete(job, self.worker_id, result)
+        print(f"Job {job['_id']} ({job['key']}) done: {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run repo stats jobs from the shared queue.")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="jobs run at the same time")
+    parser.add_argument("--enqueue-refresh", action="store_true", help="queue a refresh of every repo and exit")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT, help="serve /metrics on this port (0: off)")
+    args = parser.parse_args()
+    metrics.enable(args.metrics_port)
+    if args.enqueue_refresh:
+        asyncio.run(enqueue_refresh_all())
+    else:
+        asyncio.run(Worker(args.concurrency).run())
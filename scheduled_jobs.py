@@ -0,0 +1,80 @@
+import os
+
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from dotenv import load_dotenv
+
+import metrics
+from broadcast import send_message_to_target
+
+load_dotenv()
+SCHEDULER_DB_URL = os.getenv("SCHEDULER_DB_URL", "sqlite:///scheduled_jobs.sqlite3")
+
+# Set by bind() once the bot exists; jobs loaded from the store look it up here
+_bot = None
+
+
+def bind(bot):
+    global _bot
+    _bot = bot
+
+
+def create_scheduler():
+    """
+    Scheduler whose jobs survive restarts. Jobs are stored with IDs only and
+    resolved when they fire. After downtime, an overdue one-time job runs once,
+    and a recurring job that missed several runs runs once (coalesced) rather
+    than replaying them all.
+    """
+    return AsyncIOScheduler(
+        jobstores={"default": SQLAlchemyJobStore(url=SCHEDULER_DB_URL)},
+        job_defaults={"coalesce": True, "misfire_grace_time": None, "max_instances": 1},
+    )
+
+
+def schedule_message(scheduler, ctx, target, target_type, message, trigger, **trigger_args):
+    """Persist a scheduled send to `target` (a member or role), reporting back to ctx's channel."""
+    return scheduler.add_job(
+        send_scheduled_message,
+        trigger,
+        args=[ctx.guild.id, target.id, target_type, ctx.channel.id, message],
+        **trigger_args,
+    )
+
+
+async def send_scheduled_message(guild_id, target_id, target_type, channel_id, message):
+    with metrics.timed(metrics.JOB_LATENCY, job="send_scheduled_message"):
+        await _send_scheduled_message(guild_id, target_id, target_type, channel_id, message)
+
+
+async def _send_scheduled_message(guild_id, target_id, target_type, channel_id, message):
+    guild = _bot.get_guild(guild_id)
+    channel = _bot.get_channel(channel_id)
+    if guild is None or channel is None:
+        print(f"Scheduled message skipped: guild {guild_id} or channel {channel_id} is gone")
+        return
+
+    if target_type == 'role':
+        target = guild.get_role(target_id)
+    else:
+        target = guild.get_member(target_id)
+    if target is None:
+        await channel.send(f"Scheduled message skipped: the {target_type} with ID {target_id} no longer exists.")
+        return
+
+    await send_message_to_target(target, target_type, message, channel)
+
+
+def describe_job(job):
+    """One line for schedule-list: ID, next run, target and the start of the message."""
+    description = f"Job ID: {job.id}, Next Run: {job.next_run_time}"
+    if job.func is send_scheduled_message:
+        guild_id, target_id, target_type, _, message = job.args
+        guild = _bot.get_guild(guild_id) if _bot else None
+        target = None
+        if guild is not None:
+            target = guild.get_role(target_id) if target_type == 'role' else guild.get_member(target_id)
+        name = target.name if target is not None else target_id
+        preview = message if len(message) <= 40 else message[:37] + "..."
+        description += f", To: {name} ({target_type}), Message: {preview}"
+    return description
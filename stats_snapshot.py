@@ -0,0 +1,102 @@
+import asyncio
+import os
+import time
+
+import discord
+
+import repo_store
+
+# Longest a $stats answer can lag behind the database when no change is announced
+STATS_REFRESH_SECONDS = float(os.getenv("STATS_REFRESH_SECONDS", "300"))
+# After a change notification, wait this long so a burst of new repos costs one refresh
+STATS_NOTIFY_DELAY = 2.0
+TOP_REPOS = 5
+TOP_LANGUAGES = 10
+
+
+class StatsSnapshot:
+    """One read of the global stats, with the $stats embed already built from it."""
+
+    def __init__(self, version, stats, top_repos):
+        self.version = version
+        self.taken_at = time.time()
+        self.stats = stats
+        self.top_repos = top_repos
+        self.embed = render_embed(self)
+
+
+def render_embed(snapshot):
+    stats = snapshot.stats
+    embed = discord.Embed(
+        title="Hackathon Stats",
+        description=(
+            f"**{stats['repo_count']:,}** repos, **{stats['total_files']:,}** files, "
+            f"**{stats['total_lines']:,}** lines of code"
+        ),
+    )
+
+    languages = sorted(stats["language_totals"].values(), key=lambda language: language.get("lines", 0), reverse=True)
+    if languages:
+        lines = [
+            f"{language.get('name', '?')}: {language.get('lines', 0):,} lines in {language.get('count', 0):,} files"
+            f" ({language.get('repos', 0)} repos)"
+            for language in languages[:TOP_LANGUAGES]
+        ]
+        if len(languages) > TOP_LANGUAGES:
+            lines.append(f"and {len(languages) - TOP_LANGUAGES} more")
+        embed.add_field(name="Languages", value="\n".join(lines)[:1024], inline=False)
+
+    if snapshot.top_repos:
+        lines = [
+            f"{i}. `{repo['github_user']}/{repo['github_repo']}`: "
+            f"{repo['file_stats']['repo_stats'].get('total_lines', 0):,} lines"
+            for i, repo in enumerate(snapshot.top_repos, 1)
+        ]
+        embed.add_field(name="Top Repos", value="\n".join(lines)[:1024], inline=False)
+
+    embed.set_footer(text=f"Snapshot {snapshot.version}")
+    embed.timestamp = discord.utils.utcnow()
+    return embed
+
+
+class StatsCache:
+    """
+    Serves $stats from memory. `run()` rebuilds the snapshot every
+    STATS_REFRESH_SECONDS, or straight away after `notify()` says a repo was
+    stored, so answering the command never touches Mongo or GitHub.
+    """
+
+    def __init__(self, interval=STATS_REFRESH_SECONDS):
+        self.interval = interval
+        self.current = None
+        self._version = 0
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def notify(self):
+        self._changed.set()
+
+    async def refresh(self):
+        # Clear first: a change announced while we read is picked up by the next pass
+        self._changed.clear()
+        stats = await repo_store.get_global_stats()
+        top_repos = await repo_store.get_top_repos(TOP_REPOS)
+        self._version += 1
+        self.current = StatsSnapshot(self._version, stats, top_repos)
+        return self.current
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Stats refresh failed: {e}")
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.interval)
+                await asyncio.sleep(STATS_NOTIFY_DELAY)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
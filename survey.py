@@ -0,0 +1,98 @@
+import os
+import time
+
+import discord
+
+QUESTIONS = [
+    "Thermometer Testing: 1-10 + explanation\nFunction (integer) - how well solution/approach works:",
+    "Elegance (integer) - the beauty of the design, thinking beauty:",
+    "Effort (integer) - How hard you worked:",
+    "Resources (list) - list the number, name, and kinds of resources (type 'done' when finished):"
+]
+
+# A survey with no reply for this long is dropped
+SURVEY_TTL_SECONDS = int(os.getenv("SURVEY_TTL_SECONDS", str(60 * 60)))
+INVALID_SCORE = "Please enter a valid integer between 1 and 10."
+
+
+class SurveySession:
+    def __init__(self, user):
+        self.user = user
+        self.step = 0
+        self.responses = []
+        self.resources = []
+        self.last_activity = time.monotonic()
+
+
+class SurveySessions:
+    """
+    Thermometer check-ins as a state machine, one session per user ID.
+
+    `start()` opens a session and sends the first question; `handle_dm()` is
+    called from on_message and feeds a DM to its sender's session with a dict
+    lookup, so nothing waits on the gateway between answers. When the last
+    question is answered, `on_complete(user_id, responses)` is awaited with
+    the same `[(question, answer), ...]` list the old survey saved.
+    """
+
+    def __init__(self, on_complete, ttl=SURVEY_TTL_SECONDS):
+        self.on_complete = on_complete
+        self.ttl = ttl
+        self.sessions = {}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def start(self, user):
+        """Begin a survey unless the user already has one running. Returns True if started."""
+        if user.id in self.sessions:
+            return False
+        self.sessions[user.id] = SurveySession(user)
+        try:
+            await user.send(QUESTIONS[0])
+        except discord.HTTPException as e:
+            print(f"Could not start survey for {user.name}: {e}")
+            self.sessions.pop(user.id, None)
+            return False
+        return True
+
+    async def handle_dm(self, message):
+        """Apply a DM to its sender's survey. Returns False if they have no survey running."""
+        session = self.sessions.get(message.author.id)
+        if session is None:
+            return False
+        session.last_activity = time.monotonic()
+        content = message.content.strip()
+
+        if session.step < len(QUESTIONS) - 1:
+            question = QUESTIONS[session.step]
+            try:
+                value = int(content)
+            except ValueError:
+                value = None
+            if value is None or not 1 <= value <= 10:
+                await session.user.send(INVALID_SCORE)
+                await session.user.send(question)
+                return True
+            session.responses.append((question, content))
+            session.step += 1
+            await session.user.send(QUESTIONS[session.step])
+            return True
+
+        # The resources question collects lines until "done"
+        if content.lower() != 'done':
+            session.resources.append(message.content)
+            return True
+
+        del self.sessions[session.user.id]
+        session.responses.append((QUESTIONS[-1], session.resources))
+        await self.on_complete(session.user.id, session.responses)
+        return True
+
+    def evict_expired(self):
+        """Drop sessions idle for longer than the TTL and return how many were dropped."""
+        cutoff = time.monotonic() - self.ttl
+        expired = [user_id for user_id, session in self.sessions.items() if session.last_activity < cutoff]
+        for user_id in expired:
+            del self.sessions[user_id]
+        return len(expired)
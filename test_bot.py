@@ -5,22 +5,27 @@ from discord.ext import commands, tasks
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import random
-import json
-import plotly.graph_objects as go
-import plotly.io as pio
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import io
+import time
+from apscheduler.jobstores.base import JobLookupError
 
-from pymongo import MongoClient
-from dotenv import load_dotenv
-from file_count import add_repo_to_db
+import db
+import scheduled_jobs
+import job_queue
+import metrics
+from charts import ChartRenderer
+from cohort_stats import CohortScores, format_summary
+from guild_directory import GuildDirectory
+from repo_ingest import ProgressMessage
+from repo_worker import enqueue_add_repo
+from stats_snapshot import StatsCache
+from survey import SurveySessions
+from thermometer_store import get_thermometer_store
 
 
 
 load_dotenv()
 
-uri = os.getenv("MONGO_URI")
-client = MongoClient(uri)
-
 BOT_TOKEN = os.getenv("DISCORD_TOKEN")
 GUILD_TOKEN = os.getenv('DISCORD_GUILD')
 
@@ -30,28 +35,100 @@ intents.members = True
 
 bot = commands.Bot(command_prefix='$', intents=intents)
 
-scheduler = AsyncIOScheduler()
+# Jobs are kept in SQLite so they survive restarts (see scheduled_jobs)
+scheduler = scheduled_jobs.create_scheduler()
+scheduled_jobs.bind(bot)
+# add_repo replies waiting on a worker: job ID -> (ProgressMessage, "owner/repo")
+watched_jobs = {}
+directory = GuildDirectory()
+chart_renderer = ChartRenderer()
+cohort = CohortScores()
+stats_cache = StatsCache()
+surveys = SurveySessions(on_complete=lambda user_id, responses: save_responses_to_file(user_id, responses))
+
+metrics.Gauge("bot_pending_surveys", "Thermometer surveys waiting on an answer", function=lambda: len(surveys))
+metrics.Gauge("bot_scheduled_jobs", "Scheduled messages in the job store",
+              function=lambda: len(scheduler.get_jobs()) if scheduler.running else None)
+metrics.Gauge("bot_watched_repo_jobs", "add_repo replies waiting on a worker", function=lambda: len(watched_jobs))
+
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    # Runs whether or not the command raised
+    if metrics.ENABLED and hasattr(ctx, "started_at"):
+        outcome = "error" if ctx.command_failed else "ok"
+        metrics.COMMAND_LATENCY.observe(time.perf_counter() - ctx.started_at, command=ctx.command.qualified_name, outcome=outcome)
 
 
 @bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
 async def on_ready():
     print(f'Logged in as {bot.user}')
+    try:
+        await db.ping()
+        print("Pinged your deployment. You successfully connected to MongoDB!")
+    except Exception as e:
+        print(e)
     # if not send_scheduled_messages.is_running():
     #     send_scheduled_messages.start()
-    scheduler.start()
+    # on_ready fires again after reconnects; stored jobs are loaded on the first start
+    if not scheduler.running:
+        scheduler.start()
+    if not evict_abandoned_surveys.is_running():
+        evict_abandoned_surveys.start()
+    stats_cache.start()
+    await metrics.start_server()
+    await chart_renderer.warm_up()
 
 def get_user_or_role(ctx, identifier):
-    # Check if the identifier is a user
-    user = discord.utils.get(ctx.guild.members, name=identifier)
-    if user:
-        return user, 'user'
-    
-    # Check if the identifier is a role
-    role = discord.utils.get(ctx.guild.roles, name=identifier)
-    if role:
-        return role, 'role'
-    
-    return None, None
+    # Users first, then roles; accepts names, nicknames, IDs and mentions in any case
+    return directory.lookup(ctx.guild, identifier)
+
+
+# Keep the member/role index in step with the guild
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_member_join(member):
+    directory.member_added(member)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_member_remove(member):
+    directory.member_removed(member)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_member_update(before, after):
+    directory.member_updated(after)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_user_update(before, after):
+    directory.user_updated(after, after.mutual_guilds)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_guild_role_create(role):
+    directory.role_added(role)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_guild_role_delete(role):
+    directory.role_removed(role)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_guild_role_update(before, after):
+    directory.role_updated(after)
+
+@bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
+async def on_guild_remove(guild):
+    directory.forget_guild(guild)
 
 
 @bot.command(name='99')
@@ -107,10 +184,7 @@ async def schedule_command(ctx):
             message = message_response.content
 
 
-            async def send_message():
-                await send_message_to_target(target, target_type, message, ctx)
-
-            scheduler.add_job(send_message, 'date', run_date=date_time)
+            scheduled_jobs.schedule_message(scheduler, ctx, target, target_type, message, 'date', run_date=date_time)
             await ctx.send(f"One-time message scheduled for {date_time}.")
 
         elif response.content == '2':  # Recurring schedule
@@ -151,11 +225,12 @@ async def schedule_command(ctx):
             message_response = await bot.wait_for('message', check=check, timeout=60.0)
             message = message_response.content
 
-            async def send_message():
-                await send_message_to_target(target, target_type, message, ctx)
-
-            scheduler.add_job(
-                send_message,
+            scheduled_jobs.schedule_message(
+                scheduler,
+                ctx,
+                target,
+                target_type,
+                message,
                 'interval',
                 start_date=start_date_time,
                 end_date=end_date_time,
@@ -170,29 +245,6 @@ async def schedule_command(ctx):
         await ctx.send("You took too long to respond. Please try again.")
 
 
-async def send_message_to_target(target, target_type, message, ctx):
-    """
-    Sends a message to a target. If the target is a role, sends the message to all members of the role.
-    """
-    if target_type == 'role':
-        for member in target.members:
-            if not member.bot:  # Skip bot accounts
-                try:
-                    await member.send(message)
-                except discord.Forbidden:
-                    await ctx.send(f"Could not send message to {member.name} (DMs might be closed).")
-                except discord.HTTPException as e:
-                    await ctx.send(f"Failed to send message to {member.name} due to an error: {e}")
-    else:
-        try:
-            await target.send(message)
-            await ctx.send(f"Message sent to {target.name}.")
-        except discord.Forbidden:
-            await ctx.send(f"Could not send message to {target.name} (DMs might be closed).")
-        except discord.HTTPException as e:
-            await ctx.send(f"Failed to send message to {target.name} due to an error: {e}")
-
-
 @bot.command(name='schedule-list')
 @commands.has_permissions(administrator=True)
 async def list_jobs(ctx):
@@ -203,16 +255,20 @@ async def list_jobs(ctx):
     if not jobs:
         await ctx.send("No scheduled jobs at the moment.")
     else:
-        job_list = "\n".join([f"Job ID: {job.id}, Next Run: {job.next_run_time}" for job in jobs])
+        job_list = "\n".join([scheduled_jobs.describe_job(job) for job in jobs])
         await ctx.send(f"Scheduled Jobs:\n{job_list}")
 
 @bot.command(name='schedule-remove')
 @commands.has_permissions(administrator=True)
 async def remove_job(ctx, job_id: str):
     """
-    List all scheduled jobs with their IDs and next run times.
+    Remove a scheduled job by the ID shown in schedule-list.
     """
-    scheduler.remove_job(job_id)
+    try:
+        scheduler.remove_job(job_id)
+    except JobLookupError:
+        await ctx.send(f"No scheduled job with ID {job_id}.")
+        return
     await ctx.send(f"Removed: (JOB ID): {job_id}")
 
 
@@ -272,76 +328,23 @@ async def remove_job(ctx, job_id: str):
 #             scheduled_messages[i] = (target_id, is_role, message, now + timedelta(minutes=interval), interval)
 #             print(f"Rescheduled message for target ID {target_id} to send at {now + timedelta(minutes=interval)}")
 
-user_responses = {}
+async def save_responses_to_file(user_id, responses):
+    response_number = await asyncio.to_thread(get_thermometer_store().append, user_id, responses)
+    chart_renderer.invalidate(user_id)
+    print(f"Saved thermometer response {response_number} for user {user_id}")
 
-async def start_survey(user):
-    questions = [
-        "Thermometer Testing: 1-10 + explanation\nFunction (integer) - how well solution/approach works:",
-        "Elegance (integer) - the beauty of the design, thinking beauty:",
-        "Effort (integer) - How hard you worked:",
-        "Resources (list) - list the number, name, and kinds of resources (type 'done' when finished):"
-    ]
-    if user.id not in user_responses:
-        user_responses[user.id] = []
-
-    for question in questions[:-1]:
-        while True:
-            await user.send(question)
-            def check(m):
-                return m.author == user and isinstance(m.channel, discord.DMChannel)
-            response = await bot.wait_for('message', check=check)
-            try:
-                value = int(response.content)
-                if 1 <= value <= 10:
-                    user_responses[user.id].append((question, response.content))
-                    break
-                else:
-                    await user.send("Please enter a valid integer between 1 and 10.")
-            except ValueError:
-                await user.send("Please enter a valid integer between 1 and 10.")
-
-    # Handle the "Resources" question separately
-    await user.send(questions[-1])
-    resources = []
-    while True:
-        def check(m):
-            return m.author == user and isinstance(m.channel, discord.DMChannel)
-        response = await bot.wait_for('message', check=check)
-        if response.content.lower() == 'done':
-            break
-        resources.append(response.content)
-    user_responses[user.id].append((questions[-1], resources))
-
-    await save_responses_to_file(user.id)
-
-async def save_responses_to_file(user_id):
-    folder = 'thermometer_responses'
-    os.makedirs(folder, exist_ok=True)
-    filename = os.path.join(folder, f'{user_id}.json')
-    data = []
-
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            data = json.load(f)
-
-    response_number = len(data) + 1
-    data.append({
-        "response_number": response_number,
-        "responses": user_responses[user_id]
-    })
-
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
+@tasks.loop(minutes=5)
+async def evict_abandoned_surveys():
+    dropped = surveys.evict_expired()
+    if dropped:
+        print(f"Dropped {dropped} abandoned surveys")
 
 @bot.command(name='my_temps')
 async def get_responses(ctx):
-    folder = 'thermometer_responses'
     user_id = ctx.author.id
-    filename = os.path.join(folder, f'{user_id}.json')
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            data = json.load(f)
-
+    store = get_thermometer_store()
+    entries = await asyncio.to_thread(lambda: list(store.iter_user(user_id)))
+    if entries:
         # Extract responses for plotting
         response_numbers = []
         function_scores = []
@@ -349,38 +352,22 @@ async def get_responses(ctx):
         effort_scores = []
         resources_list = []
 
-        for entry in data:
+        for entry in entries:
             response_numbers.append(entry["response_number"])
-            for question, response in entry["responses"]:
-                if "Function" in question:
-                    function_scores.append(int(response))
-                elif "Elegance" in question:
-                    elegance_scores.append(int(response))
-                elif "Effort" in question:
-                    effort_scores.append(int(response))
-                elif "Resources" in question:
-                    resources_list.append(response)
-
-        # Create the plot
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=response_numbers, y=function_scores, mode='lines+markers', name='Function'))
-        fig.add_trace(go.Scatter(x=response_numbers, y=elegance_scores, mode='lines+markers', name='Elegance'))
-        fig.add_trace(go.Scatter(x=response_numbers, y=effort_scores, mode='lines+markers', name='Effort'))
-
-        fig.update_layout(title='Thermometer Responses',
-                          xaxis_title='Response Number',
-                          yaxis_title='Score',
-                          legend_title='Questions')
-
-        # Save the plot as an image
-        image_path = os.path.join(folder, f'{user_id}_plot.png')
-        pio.write_image(fig, image_path)
+            function_scores.append(entry["function"])
+            elegance_scores.append(entry["elegance"])
+            effort_scores.append(entry["effort"])
+            resources_list.append(entry["resources"])
+
+        png = await chart_renderer.thermometer_chart(
+            user_id, response_numbers, function_scores, elegance_scores, effort_scores
+        )
 
         # Prepare resources text
         resources_text = "\n\n".join([f"Response {i+1}:\n" + "\n".join(resources) for i, resources in enumerate(resources_list)])
 
         # Send the plot as an embed
-        file = discord.File(image_path, filename=f'{user_id}_plot.png')
+        file = discord.File(io.BytesIO(png), filename=f'{user_id}_plot.png')
         embed = discord.Embed(title="Your Thermometer Data")
         embed.set_image(url=f'attachment://{user_id}_plot.png')
         embed.add_field(name="Resources", value=resources_text if resources_text else "No resources provided", inline=False)
@@ -389,16 +376,82 @@ async def get_responses(ctx):
         await ctx.author.send("You have no recorded responses.")
 
 
-
+@bot.command(name='cohort_temps')
+@commands.has_permissions(administrator=True)
+async def cohort_temps(ctx, bucket_hours: float = 2.0):
+    """Cohort-wide thermometer averages per time bucket, plus attendees whose effort is dropping."""
+    if bucket_hours <= 0:
+        await ctx.send("Bucket size must be a positive number of hours.")
+        return
+    cohort.refresh(get_thermometer_store())
+    summary = cohort.bucket_summary(bucket_hours * 3600)
+    dropping = cohort.effort_dropping()
+    names = {}
+    if ctx.guild is not None:
+        for user_id, _, _ in dropping:
+            member = ctx.guild.get_member(user_id)
+            if member is not None:
+                names[user_id] = member.display_name
+    await ctx.send(format_summary(summary, dropping, bucket_hours, names))
+
+
+
+@bot.command(name='stats')
+async def stats(ctx):
+    """Global hackathon stats, answered from the in-memory snapshot."""
+    snapshot = stats_cache.current
+    if snapshot is None:
+        await ctx.send("Stats are still loading, try again in a moment.")
+        return
+    await ctx.send(embed=snapshot.embed)
 
 
 @bot.command(name='add_repo')
 async def add_repo(ctx, owner: str, repo_name: str):
-    success = add_repo_to_db(owner, repo_name, str(ctx.author), client)
-    if success:
-        await ctx.send(f" Added and processed `{owner}/{repo_name}`.")
-    else:
-        await ctx.send(f" Could not add `{owner}/{repo_name}`. It may already exist or failed to fetch.")
+    """
+    Queue a repo for the repo workers and reply straight away; the reply is
+    kept updated with the job's progress (see watch_repo_jobs).
+    """
+    job_id = await enqueue_add_repo(owner, repo_name, str(ctx.author))
+    if job_id is None:
+        await ctx.send(f" `{owner}/{repo_name}` is already being processed.")
+        return
+
+    status_message = await ctx.send(f" Queued `{owner}/{repo_name}` for processing...")
+    watched_jobs[job_id] = (ProgressMessage(status_message, f"`{owner}/{repo_name}`"), f"{owner}/{repo_name}")
+    if not watch_repo_jobs.is_running():
+        watch_repo_jobs.start()
+
+@tasks.loop(seconds=2)
+async def watch_repo_jobs():
+    # One query per tick for every add_repo reply still waiting on its job
+    if not watched_jobs:
+        return
+    # Any error is logged and tried again next tick; an exception escaping
+    # would stop the loop and freeze every reply still waiting
+    try:
+        jobs = await job_queue.get_jobs(watched_jobs)
+    except Exception as e:
+        print(f"Could not check add_repo jobs: {type(e).__name__}: {e}")
+        return
+    for job in jobs:
+        progress, name = watched_jobs[job["_id"]]
+        try:
+            if job["status"] == job_queue.DONE:
+                del watched_jobs[job["_id"]]
+                if job["result"]["added"]:
+                    stats_cache.notify()
+                    await progress.finish(f" Added and processed `{name}`.")
+                else:
+                    await progress.finish(f" `{name}` is already registered.")
+            elif job["status"] == job_queue.FAILED:
+                del watched_jobs[job["_id"]]
+                await progress.finish(f" Could not add `{name}`. It may not exist or failed to fetch.")
+            elif job.get("progress"):
+                progress.update(**job["progress"])
+        except Exception as e:
+            # e.g. the reply was deleted; the job itself is unaffected
+            print(f"Could not update the reply for {name}: {type(e).__name__}: {e}")
 
 
 """
@@ -406,13 +459,19 @@ This @bot.event is an override and we need to add the message processor
 back to the main thread with `await bot.process_commands(message)`
 """
 @bot.event
+@metrics.timed_event(metrics.EVENT_LATENCY)
 async def on_message(message):
     if message.author == bot.user:
         return
 
     # Check if the message is in the specified channel
     if message.channel.id == 1309259804333572217:
-        await start_survey(message.author)
+        await surveys.start(message.author)
+
+    # Survey answers arrive as DMs; commands typed in DMs still go to the command handler
+    if isinstance(message.channel, discord.DMChannel) and not message.content.startswith(bot.command_prefix):
+        if await surveys.handle_dm(message):
+            return
 
     if message.content.startswith('$hello'):
         await message.channel.send('Hello!')
@@ -420,4 +479,6 @@ async def on_message(message):
     # needed to process other `bot.commands`
     await bot.process_commands(message)
 
-bot.run(BOT_TOKEN)
\ No newline at end of file
+# Chart workers are spawned processes that import this module; only the parent runs the bot
+if __name__ == "__main__":
+    bot.run(BOT_TOKEN)
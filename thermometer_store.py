@@ -0,0 +1,169 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+THERMOMETER_DB_PATH = os.getenv("THERMOMETER_DB_PATH", "thermometer_responses.sqlite3")
+# Where save_responses_to_file used to keep one JSON file per user
+LEGACY_RESPONSES_FOLDER = 'thermometer_responses'
+
+
+def _fields_from_answers(answers):
+    """
+    Map the survey's `[(question, answer), ...]` onto columns, matching questions
+    by keyword. Later answers win: entries in the old JSON files repeat every
+    earlier survey's answers before their own.
+    """
+    fields = {"function": None, "elegance": None, "effort": None, "resources": []}
+    for question, answer in answers:
+        if "Function" in question:
+            fields["function"] = int(answer)
+        elif "Elegance" in question:
+            fields["elegance"] = int(answer)
+        elif "Effort" in question:
+            fields["effort"] = int(answer)
+        elif "Resources" in question:
+            fields["resources"] = answer
+    return fields
+
+
+class ThermometerStore:
+    """
+    Append-only log of thermometer submissions, one row per completed survey.
+
+    Each submission is a single-row insert in its own transaction, so a save
+    costs the same on the first check-in as on the fiftieth and a crash never
+    leaves a half-written history behind.
+
+    Safe to call from worker threads; the bot runs saves and reads through
+    `asyncio.to_thread` so a slow disk never stalls the event loop.
+    """
+
+    def __init__(self, path=THERMOMETER_DB_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " id INTEGER PRIMARY KEY,"
+            " user_id INTEGER NOT NULL,"
+            " response_number INTEGER NOT NULL,"
+            " submitted_at REAL NOT NULL,"
+            " function INTEGER,"
+            " elegance INTEGER,"
+            " effort INTEGER,"
+            " resources TEXT NOT NULL,"
+            " UNIQUE (user_id, response_number))"
+        )
+        self.conn.commit()
+
+    def append(self, user_id, answers, submitted_at=None):
+        """Record one completed survey and return its response number for the user."""
+        fields = _fields_from_answers(answers)
+        with self.lock, self.conn:
+            (response_number,) = self.conn.execute(
+                "SELECT COALESCE(MAX(response_number), 0) + 1 FROM responses WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+            self.conn.execute(
+                "INSERT INTO responses (user_id, response_number, submitted_at, function, elegance, effort, resources)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    response_number,
+                    submitted_at if submitted_at is not None else time.time(),
+                    fields["function"],
+                    fields["elegance"],
+                    fields["effort"],
+                    json.dumps(fields["resources"], separators=(",", ":")),
+                ),
+            )
+        return response_number
+
+    def iter_user(self, user_id):
+        """Yield a user's submissions oldest first as dicts."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT response_number, submitted_at, function, elegance, effort, resources"
+                " FROM responses WHERE user_id = ? ORDER BY response_number",
+                (user_id,),
+            ).fetchall()
+        for response_number, submitted_at, function, elegance, effort, resources in rows:
+            yield {
+                "response_number": response_number,
+                "submitted_at": submitted_at,
+                "function": function,
+                "elegance": elegance,
+                "effort": effort,
+                "resources": json.loads(resources),
+            }
+
+    def scores_since(self, last_id=0):
+        """`(id, user_id, submitted_at, function, elegance, effort)` for every row added after `last_id`."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT id, user_id, submitted_at, function, elegance, effort FROM responses WHERE id > ? ORDER BY id",
+                (last_id,),
+            ).fetchall()
+
+    def count(self, user_id):
+        with self.lock:
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM responses WHERE user_id = ?", (user_id,)).fetchone()
+        return count
+
+    def import_legacy_files(self, folder=LEGACY_RESPONSES_FOLDER):
+        """
+        Copy responses from the old per-user JSON files. Rows that are already
+        present are skipped, so this is safe to run on every start.
+        """
+        imported = 0
+        for filename in glob.glob(os.path.join(folder, '*.json')):
+            user_id = os.path.splitext(os.path.basename(filename))[0]
+            if not user_id.isdigit():
+                continue
+            with open(filename, 'r') as f:
+                entries = json.load(f)
+            # The old files have no timestamps; the file's mtime is the best we have
+            submitted_at = os.path.getmtime(filename)
+            with self.lock, self.conn:
+                for entry in entries:
+                    fields = _fields_from_answers(entry["responses"])
+                    cursor = self.conn.execute(
+                        "INSERT OR IGNORE INTO responses"
+                        " (user_id, response_number, submitted_at, function, elegance, effort, resources)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            int(user_id),
+                            entry["response_number"],
+                            submitted_at,
+                            fields["function"],
+                            fields["elegance"],
+                            fields["effort"],
+                            json.dumps(fields["resources"], separators=(",", ":")),
+                        ),
+                    )
+                    imported += cursor.rowcount
+        if imported:
+            print(f"Imported {imported} thermometer responses from {folder}")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+_default_store = None
+
+
+def get_thermometer_store():
+    """The process-wide store, opened (and any legacy JSON imported) on first use."""
+    global _default_store
+    if _default_store is None:
+        _default_store = ThermometerStore()
+        _default_store.import_legacy_files()
+    return _default_store
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+from github_client import GitHubClient
+from push_updates import apply_pushes
+
+load_dotenv()
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = "/github/webhook"
+# Pushes to one repo that arrive within this many seconds of each other are applied together
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "5"))
+
+
+def verify_signature(secret, body, signature):
+    """Check GitHub's `X-Hub-Signature-256` header against the raw request body."""
+    if not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class PushDebouncer:
+    """
+    Collects push payloads per repo and hands each repo's batch to `handler`
+    once no push has arrived for `delay` seconds. A repo is never handled
+    twice at once; pushes that arrive meanwhile form the next batch.
+    """
+
+    def __init__(self, handler, delay=WEBHOOK_DEBOUNCE_SECONDS):
+        self.handler = handler
+        self.delay = delay
+        self.pending = {}
+        self._timers = {}
+        self._running = {}
+
+    def add(self, key, payload):
+        self.pending.setdefault(key, []).append(payload)
+        self._schedule(key)
+
+    def _schedule(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self._timers[key] = asyncio.get_running_loop().call_later(self.delay, self._fire, key)
+
+    def _fire(self, key):
+        del self._timers[key]
+        if key in self._running:
+            # Picked up when the current batch finishes
+            return
+        payloads = self.pending.pop(key)
+        self._running[key] = asyncio.create_task(self._run(key, payloads))
+
+    async def _run(self, key, payloads):
+        try:
+            await self.handler(key, payloads)
+        except Exception as e:
+            print(f"Applying {len(payloads)} pushes to {key[0]}/{key[1]} failed: {type(e).__name__}: {e}")
+        finally:
+            del self._running[key]
+            if key in self.pending and key not in self._timers:
+                self._schedule(key)
+
+
+def create_app(github, secret=GITHUB_WEBHOOK_SECRET, delay=WEBHOOK_DEBOUNCE_SECONDS):
+    async def handle(key, payloads):
+        owner, repo_name = key
+        outcome = await apply_pushes(github, owner, repo_name, payloads)
+        print(f"{owner}/{repo_name}: {outcome} from {len(payloads)} pushes")
+
+    debouncer = PushDebouncer(handle, delay)
+
+    async def webhook(request):
+        body = await request.read()
+        if not verify_signature(secret, body, request.headers.get("X-Hub-Signature-256")):
+            return web.Response(status=401, text="bad signature")
+
+        event = request.headers.get("X-GitHub-Event")
+        if event == "ping":
+            return web.Response(text="pong")
+        if event != "push":
+            return web.Response(status=204)
+
+        payload = json.loads(body)
+        repository = payload["repository"]
+        debouncer.add((repository["owner"]["login"], repository["name"]), payload)
+        # Answer straight away; GitHub gives up on deliveries that take over 10 seconds
+        return web.Response(status=202, text="queued")
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, webhook)
+    app["debouncer"] = debouncer
+    return app
+
+
+async def serve(host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    if not GITHUB_WEBHOOK_SECRET:
+        raise SystemExit("GITHUB_WEBHOOK_SECRET must be set; unsigned pushes are not accepted")
+    async with GitHubClient() as github:
+        runner = web.AppRunner(create_app(github))
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f"Listening for GitHub pushes on http://{host}:{port}{WEBHOOK_PATH}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+
+async def replay(filenames):
+    """Apply recorded push payloads (one per file, or a JSON list per file) in order, without signatures."""
+    batches = {}
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        for payload in data if isinstance(data, list) else [data]:
+            repository = payload["repository"]
+            batches.setdefault((repository["owner"]["login"], repository["name"]), []).append(payload)
+
+    async with GitHubClient() as github:
+        for (owner, repo_name), payloads in batches.items():
+            outcome = await apply_pushes(github, owner, repo_name, payloads)
+            print(f"{owner}/{repo_name}: {outcome} from {len(payloads)} pushes ({github.request_count} API calls so far)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update repo stats from GitHub push webhooks.")
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--replay", nargs="+", metavar="PAYLOAD", help="apply recorded push payloads instead of serving")
+    args = parser.parse_args()
+    if args.replay:
+        asyncio.run(replay(args.replay))
+    else:
+        asyncio.run(serve(args.host, args.port))